@@ -1,25 +1,47 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session, make_response
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session, make_response, Response
+from flask.globals import request_ctx
 import pandas as pd
+import numpy as np
 import os
+import sqlite3
+import threading
+import bisect
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from functools import wraps
+import hashlib
 from flask_mail import Mail, Message
 from dotenv import load_dotenv
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import cm, mm
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import io
 import csv
+import json
+import mmap
+import zlib
+import zipfile
+import multiprocessing
+import re
+import time
+import queue
+import click
+
 from reportlab.lib import colors
-from reportlab.graphics.shapes import Drawing
-from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.shapes import Drawing, Group, String
+from reportlab.graphics.charts.barcharts import VerticalBarChart, HorizontalBarChart
 from reportlab.graphics import renderPDF
 from io import BytesIO
 from reportlab.platypus import Table, TableStyle
 from reportlab.lib.utils import ImageReader
 from flask import jsonify
-import matplotlib
-matplotlib.use('Agg')  # para que no necesite pantalla
-import matplotlib.pyplot as plt
+
+try:
+    import fcntl
+except ImportError:  # Windows: el lock queda solo entre hilos
+    fcntl = None
 
 # ===================== FUNCIONES DE NORMALIZACIÓN =====================
 
@@ -47,15 +69,821 @@ def normalizar_rol(rol):
     return str(rol).strip().lower()
 
 
-# ===================== MANTENCIONES =====================
+# ===================== ALMACENAMIENTO MANTENCIONES =====================
 
-def cargar_mantenciones():
-    """Lee mantenciones.csv y normaliza Máquinas y Responsables."""
+MANTENCIONES_FILE = "mantenciones.csv"
+
+COLUMNAS_MANTENCIONES = [
+    'Máquina', 'Fecha', 'Descripción', 'Responsable', 'Hora_inicio', 'Hora_fin',
+    'Duración_horas', 'Tipo', 'Frecuencia_dias', 'Próximo_mantenimiento'
+]
+
+# Identificador estable de cada registro (no cambia al borrar o editar otros)
+ID_COL = 'ID'
+
+# Cada cuántos registros agregados al final del CSV se reescribe completo
+COMPACTAR_CADA = int(os.getenv("MANTENCIONES_COMPACTAR_CADA", "500"))
+
+_bloqueos_hilos = {}
+_bloqueos_hilos_lock = threading.Lock()
+_bloqueos_tomados = threading.local()
+
+
+def _bloqueo_hilo(ruta):
+    with _bloqueos_hilos_lock:
+        return _bloqueos_hilos.setdefault(ruta, threading.Lock())
+
+
+@contextmanager
+def bloqueo_archivo(ruta, compartido=False):
+    """Lock de <ruta>.lock entre hilos y procesos: compartido para leer, exclusivo y reentrante para escribir."""
+    tomados = getattr(_bloqueos_tomados, 'rutas', None)
+    if tomados is None:
+        tomados = _bloqueos_tomados.rutas = set()
+
+    if compartido:
+        if ruta in tomados or not fcntl:
+            yield None
+            return
+        with open(ruta + ".lock", "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return
+
+    with _bloqueo_hilo(ruta):
+        with open(ruta + ".lock", "a+", encoding="utf-8") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            tomados.add(ruta)
+            try:
+                yield f
+            finally:
+                tomados.discard(ruta)
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _leer_estado(f_lock):
+    """Estado (dict) guardado como JSON en un archivo de lock."""
+    f_lock.seek(0)
+    try:
+        return json.loads(f_lock.read() or "{}")
+    except ValueError:
+        return {}
+
+
+def _guardar_estado(f_lock, **valores):
+    estado = _leer_estado(f_lock)
+    estado.update(valores)
+    f_lock.seek(0)
+    f_lock.truncate()
+    f_lock.write(json.dumps(estado))
+    f_lock.flush()
+
+
+def asegurar_ids(df):
+    """Garantiza una columna ID entera y única, con correlativos nuevos en el orden del archivo."""
+    if df.empty:
+        return df
+
+    if ID_COL not in df.columns:
+        df.insert(0, ID_COL, range(1, len(df) + 1))
+        return df
+
+    ids = pd.to_numeric(df[ID_COL], errors='coerce')
+    faltan = ids.isna() | ids.duplicated()
+    if faltan.any():
+        base = int(ids[~faltan].max()) if (~faltan).any() else 0
+        ids[faltan] = range(base + 1, base + 1 + int(faltan.sum()))
+    df[ID_COL] = ids.astype('int64')
+    return df
+
+
+def siguiente_id(df):
+    """Próximo ID libre para un DataFrame de mantenciones."""
+    if df.empty or ID_COL not in df.columns:
+        return 1
+    return int(df[ID_COL].max()) + 1
+
+
+def encabezado_csv(ruta):
+    """Nombres de columna de un CSV, o None si no existe o está vacío."""
     try:
-        df = pd.read_csv("mantenciones.csv")
+        with open(ruta, newline='', encoding='utf-8') as f:
+            return next(csv.reader(f), None)
     except FileNotFoundError:
-        return pd.DataFrame()
+        return None
+
+
+def reescribir_csv(ruta, df):
+    """Escritura atómica: los lectores ven el archivo viejo o el nuevo, nunca uno a medias."""
+    tmp = ruta + ".tmp"
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, ruta)
+
+
+def agregar_filas_csv(ruta, encabezado, filas):
+    """Append de filas (dicts) en el orden de columnas del encabezado, en una sola escritura."""
+    lineas = io.StringIO()
+    escritor = csv.writer(lineas, lineterminator="\n")
+    for fila in filas:
+        escritor.writerow(["" if fila.get(col) is None else fila.get(col) for col in encabezado])
+
+    with open(ruta, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        f.write(lineas.getvalue().encode('utf-8'))
+
+
+class AlmacenCSV:
+    """Backend por defecto: CSV plano, con journal y group commit de las escrituras."""
+
+    # Si las consultas por fecha se resuelven leyendo menos datos que la caché
+    PODA_POR_FECHA = False
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.ruta_journal = ruta + ".journal"
+        self._local = threading.local()
+
+    def ultima_escritura(self):
+        """Firma antes/después de la última escritura de este hilo y si fue la única del grupo (o None)."""
+        return getattr(self._local, 'ultima', None)
+
+    def firma(self):
+        """(mtime, tamaño) del archivo, o None si no existe."""
+        try:
+            st = os.stat(self.ruta)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def modificado(self):
+        """Fecha de la última escritura (timestamp POSIX), o None si no hay datos."""
+        firma = self.firma()
+        return firma[0] / 1e9 if firma else None
+
+    def leer(self):
+        return self.leer_incremental()[0]
+
+    def _huella(self, mm, fin, inicio=0, crc=0):
+        """crc32 de mm[inicio:fin] sin copiar los bytes, continuando desde crc."""
+        with memoryview(mm) as vista, vista[inicio:fin] as tramo:
+            return zlib.crc32(tramo, crc)
+
+    def leer_incremental(self, anterior=None):
+        """(df, lectura, solo_cola): solo las filas nuevas si el archivo solo creció; si no, el archivo completo."""
+        with bloqueo_archivo(self.ruta, compartido=True):
+            try:
+                st = os.stat(self.ruta)
+            except FileNotFoundError:
+                return pd.DataFrame(), None, False
+
+            if st.st_size == 0:
+                return pd.DataFrame(), None, False
+
+            with open(self.ruta, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if (anterior and anterior['inodo'] == st.st_ino
+                        and st.st_size >= anterior['offset']
+                        and self._huella(mm, anterior['offset']) == anterior['huella']):
+                    cola = mm[anterior['offset']:]
+                    fin = cola.rfind(b"\n") + 1  # una línea sin salto aún no está completa
+                    offset = anterior['offset'] + fin
+                    lectura = dict(anterior, offset=offset,
+                                   huella=self._huella(mm, offset, anterior['offset'], anterior['huella']))
+                    if fin == 0:
+                        return pd.DataFrame(columns=anterior['columnas']), lectura, True
+                    df = pd.read_csv(io.BytesIO(cola[:fin]), header=None, names=anterior['columnas'])
+                    return df, lectura, True
+
+                df = pd.read_csv(io.BytesIO(mm))
+                lectura = {
+                    'inodo': st.st_ino,
+                    'offset': st.st_size,
+                    'huella': self._huella(mm, st.st_size),
+                    'columnas': list(df.columns)
+                }
+                return df, lectura, False
+
+    def _compactar(self, f_lock, df=None):
+        """Reescribe el archivo completo con IDs y columnas en orden canónico."""
+        if df is None:
+            df = cargar_mantenciones()
+        df = serializar_mantenciones(asegurar_ids(df))
+        for col in [ID_COL] + COLUMNAS_MANTENCIONES:
+            if col not in df.columns:
+                df[col] = None
+        extras = [col for col in df.columns if col not in [ID_COL] + COLUMNAS_MANTENCIONES]
+        reescribir_csv(self.ruta, df[[ID_COL] + COLUMNAS_MANTENCIONES + extras])
+        _guardar_estado(f_lock, appends=0)
+
+        with bloqueo_archivo(self.ruta_journal) as f_journal:
+            proximo = _leer_estado(f_journal).get('siguiente_id') or 1
+            _guardar_estado(f_journal, siguiente_id=max(proximo, siguiente_id(df)))
+
+    # ---------- journal ----------
+
+    def _leer_journal(self):
+        entradas = []
+        try:
+            with open(self.ruta_journal, encoding='utf-8') as f:
+                for linea in f:
+                    try:
+                        entradas.append(json.loads(linea))
+                    except ValueError:
+                        break  # línea incompleta de un proceso que se cayó
+        except FileNotFoundError:
+            pass
+        return entradas
+
+    def _descartar_journal(self, cantidad):
+        """Quita del journal las primeras entradas (ya confirmadas)."""
+        with open(self.ruta_journal, 'r+', encoding='utf-8') as f:
+            restantes = f.readlines()[cantidad:]
+            f.seek(0)
+            f.truncate()
+            f.writelines(restantes)
+
+    def _registrar(self, entrada):
+        """Anota la modificación en el journal (con fsync) y devuelve el ID afectado."""
+        base = None
+        with bloqueo_archivo(self.ruta_journal) as f_journal:
+            conocido = _leer_estado(f_journal).get('siguiente_id')
+        if entrada['op'] == 'agregar' and not conocido:
+            base = siguiente_id(cargar_mantenciones())
+
+        entrada['token'] = os.urandom(8).hex()
+        with bloqueo_archivo(self.ruta_journal) as f_journal:
+            if entrada['op'] == 'agregar':
+                entrada['id'] = _leer_estado(f_journal).get('siguiente_id') or base
+                _guardar_estado(f_journal, siguiente_id=entrada['id'] + 1)
+            with open(self.ruta_journal, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entrada) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return entrada['id']
+
+    def _aplicar(self, entradas):
+        """Aplica entradas del journal sobre los datos actuales (idempotente por ID)."""
+        df, posiciones = cargar_mantenciones_indexadas()
+        df = serializar_mantenciones(df)
+
+        # Columnas a object para poder guardar el texto tal como viene del formulario
+        columnas = {col for e in entradas if e['op'] == 'actualizar' for col in e['cambios']}
+        for col in columnas:
+            if col not in df.columns:
+                df[col] = None
+        df = df.astype({col: object for col in columnas})
+
+        nuevas = {}
+        borrar = set()
+        for e in entradas:
+            id_registro = e['id']
+            pos = _posicion(posiciones, id_registro)
+            if e['op'] == 'agregar':
+                if pos is None:
+                    nuevas[id_registro] = dict(e['fila'], **{ID_COL: id_registro})
+            elif e['op'] == 'actualizar':
+                if id_registro in nuevas:
+                    nuevas[id_registro].update(e['cambios'])
+                elif pos is not None:
+                    for col, valor in e['cambios'].items():
+                        df.iloc[pos, df.columns.get_loc(col)] = valor
+            elif e['op'] == 'eliminar':
+                nuevas.pop(id_registro, None)
+                if pos is not None:
+                    borrar.add(pos)
+
+        if borrar:
+            df = df.drop(index=df.index[sorted(borrar)])
+        if nuevas:
+            df = pd.concat([df, pd.DataFrame(list(nuevas.values()))], ignore_index=True)
+        return df.reset_index(drop=True)
+
+    def _confirmar(self, token=None):
+        """Group commit: aplica en una sola escritura todo lo pendiente en el journal."""
+        self._local.ultima = None
+        with bloqueo_archivo(self.ruta) as f_lock:
+            with bloqueo_archivo(self.ruta_journal):
+                entradas = self._leer_journal()
+            if not entradas:
+                return
+            firma_antes = self.firma()
+
+            estado = _leer_estado(f_lock)
+            appends = estado.get('appends', 0) + len(entradas)
+            encabezado = encabezado_csv(self.ruta)
+            solo_agregar = (
+                all(e['op'] == 'agregar' for e in entradas)
+                and encabezado
+                and set([ID_COL] + COLUMNAS_MANTENCIONES).issubset(encabezado)
+            )
+
+            # Si el escritor anterior se cayó a mitad de camino, la reescritura
+            # completa descarta lo que ya alcanzó a quedar en el CSV.
+            recuperando = estado.get('confirmando', False)
+            _guardar_estado(f_lock, confirmando=True)
+
+            if solo_agregar and not recuperando and appends < COMPACTAR_CADA:
+                agregar_filas_csv(
+                    self.ruta, encabezado, [dict(e['fila'], **{ID_COL: e['id']}) for e in entradas]
+                )
+                _guardar_estado(f_lock, appends=appends)
+            else:
+                self._compactar(f_lock, self._aplicar(entradas))
+
+            with bloqueo_archivo(self.ruta_journal):
+                self._descartar_journal(len(entradas))
+            _guardar_estado(f_lock, confirmando=False)
+            self._local.ultima = {
+                'antes': firma_antes,
+                'despues': self.firma(),
+                'exclusiva': token is not None and len(entradas) == 1 and entradas[0].get('token') == token
+            }
+
+    # ---------- interfaz del almacén ----------
+
+    def escribir(self, df):
+        self._confirmar()
+        with bloqueo_archivo(self.ruta) as f_lock:
+            self._compactar(f_lock, df)
+        self._local.ultima = None
+
+    def compactar(self):
+        self._confirmar()
+        with bloqueo_archivo(self.ruta) as f_lock:
+            self._compactar(f_lock)
+        self._local.ultima = None
+
+    def agregar(self, fila):
+        """Registra la fila nueva, espera su confirmación y devuelve su ID."""
+        entrada = {'op': 'agregar', 'fila': fila}
+        id_registro = self._registrar(entrada)
+        self._confirmar(entrada['token'])
+        return id_registro
+
+    def actualizar(self, id_registro, cambios):
+        self._local.ultima = None
+        if obtener_mantencion(id_registro) is None:
+            return False
+        entrada = {'op': 'actualizar', 'id': id_registro, 'cambios': cambios}
+        self._registrar(entrada)
+        self._confirmar(entrada['token'])
+        return True
+
+    def eliminar(self, id_registro):
+        self._local.ultima = None
+        if obtener_mantencion(id_registro) is None:
+            return False
+        entrada = {'op': 'eliminar', 'id': id_registro}
+        self._registrar(entrada)
+        self._confirmar(entrada['token'])
+        return True
+
+    def consultar(self, maquina=None, responsable=None, fecha_desde=None, fecha_hasta=None):
+        """El CSV no tiene índices: se filtra sobre la caché (ver consultar_mantenciones)."""
+        return None
+
+
+class AlmacenSQLite:
+    """Backend SQLite (modo WAL) con índices por Máquina, Fecha, Responsable y Tipo."""
+
+    TIPOS = {'Duración_horas': 'REAL', 'Frecuencia_dias': 'REAL'}
+    PODA_POR_FECHA = False
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._local = threading.local()
+
+    def _conexion(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            columnas = ", ".join(
+                f'"{col}" {self.TIPOS.get(col, "TEXT")}' for col in COLUMNAS_MANTENCIONES
+            )
+            with conn:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS mantenciones (id INTEGER PRIMARY KEY, {columnas})")
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_mant_maquina ON mantenciones ("Máquina", "Fecha")')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_mant_fecha ON mantenciones ("Fecha")')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_mant_responsable ON mantenciones ("Responsable", "Fecha")')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_mant_tipo ON mantenciones ("Tipo")')
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor INTEGER)")
+                conn.execute("INSERT OR IGNORE INTO meta VALUES ('version', 0)")
+            self._local.conn = conn
+        return conn
+
+    def _nueva_version(self, conn):
+        """Incrementa la versión dentro de la transacción de escritura y la devuelve."""
+        conn.execute("UPDATE meta SET valor = valor + 1 WHERE clave = 'version'")
+        conn.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('modificado', ?)", (int(time.time()),))
+        return conn.execute("SELECT valor FROM meta WHERE clave = 'version'").fetchone()[0]
+
+    def _anotar_escritura(self, version):
+        # La transacción sube la versión en exactamente 1: solo contiene esta escritura
+        self._local.ultima = {'antes': ('sqlite', version - 1), 'despues': ('sqlite', version), 'exclusiva': True}
+
+    def ultima_escritura(self):
+        """Firmas antes/después de la última escritura de este hilo (ver AlmacenCSV.ultima_escritura)."""
+        return getattr(self._local, 'ultima', None)
+
+    @staticmethod
+    def _sql_columnas(columnas):
+        return ", ".join(f'"{col}"' for col in columnas)
+
+    def _leer_sql(self, where="", params=()):
+        return pd.read_sql_query(
+            f'SELECT id AS "{ID_COL}", {self._sql_columnas(COLUMNAS_MANTENCIONES)} '
+            f"FROM mantenciones {where} ORDER BY id",
+            self._conexion(),
+            params=params
+        )
+
+    def firma(self):
+        fila = self._conexion().execute("SELECT valor FROM meta WHERE clave = 'version'").fetchone()
+        return ('sqlite', fila[0])
+
+    def modificado(self):
+        """Fecha de la última escritura (guardada en meta), o el mtime de la base."""
+        fila = self._conexion().execute("SELECT valor FROM meta WHERE clave = 'modificado'").fetchone()
+        if fila:
+            return float(fila[0])
+        try:
+            return os.path.getmtime(self.ruta)
+        except OSError:
+            return None
+
+    def leer(self):
+        return self._leer_sql()
+
+    def escribir(self, df):
+        df = serializar_mantenciones(asegurar_ids(df))
+        columnas = [col for col in COLUMNAS_MANTENCIONES if col in df.columns]
+        datos = df[[ID_COL] + columnas] if ID_COL in df.columns else df[columnas]
+        filas = datos.astype(object).where(datos.notna(), None).values.tolist()
+        nombres = (["id"] if ID_COL in df.columns else []) + [f'"{col}"' for col in columnas]
+        conn = self._conexion()
+        with conn:
+            conn.execute("DELETE FROM mantenciones")
+            conn.executemany(
+                f"INSERT INTO mantenciones ({', '.join(nombres)}) "
+                f"VALUES ({', '.join('?' * len(nombres))})",
+                filas
+            )
+            self._nueva_version(conn)
+        self._local.ultima = None
+
+    def agregar(self, fila):
+        """Inserta una fila y devuelve su ID (la clave primaria de SQLite)."""
+        self._local.ultima = None
+        columnas = [col for col in COLUMNAS_MANTENCIONES if col in fila]
+        conn = self._conexion()
+        with conn:
+            cursor = conn.execute(
+                f"INSERT INTO mantenciones ({self._sql_columnas(columnas)}) "
+                f"VALUES ({', '.join('?' * len(columnas))})",
+                [fila[col] for col in columnas]
+            )
+            version = self._nueva_version(conn)
+        self._anotar_escritura(version)
+        return cursor.lastrowid
+
+    def actualizar(self, id_registro, cambios):
+        self._local.ultima = None
+        asignaciones = ", ".join(f'"{col}" = ?' for col in cambios)
+        conn = self._conexion()
+        with conn:
+            cursor = conn.execute(
+                f"UPDATE mantenciones SET {asignaciones} WHERE id = ?",
+                list(cambios.values()) + [id_registro]
+            )
+            if cursor.rowcount == 0:
+                return False
+            version = self._nueva_version(conn)
+        self._anotar_escritura(version)
+        return True
+
+    def eliminar(self, id_registro):
+        self._local.ultima = None
+        conn = self._conexion()
+        with conn:
+            cursor = conn.execute("DELETE FROM mantenciones WHERE id = ?", (id_registro,))
+            if cursor.rowcount == 0:
+                return False
+            version = self._nueva_version(conn)
+        self._anotar_escritura(version)
+        return True
+
+    def consultar(self, maquina=None, responsable=None, fecha_desde=None, fecha_hasta=None):
+        """Consulta filtrada con los índices de la base; None sin filtros (se usa la caché)."""
+        if not any((maquina, responsable, fecha_desde, fecha_hasta)):
+            return None
+        condiciones = []
+        params = []
+        if maquina:
+            condiciones.append('"Máquina" = ?')
+            params.append(maquina)
+        if responsable:
+            condiciones.append('"Responsable" = ?')
+            params.append(responsable)
+        if fecha_desde:
+            condiciones.append('"Fecha" >= ?')
+            params.append(fecha_desde.isoformat())
+        if fecha_hasta:
+            condiciones.append('"Fecha" <= ?')
+            params.append(fecha_hasta.isoformat())
+        where = "WHERE " + " AND ".join(condiciones) if condiciones else ""
+        return self._leer_sql(where, params)
+
+
+class AlmacenParticionado:
+    """Historial particionado por año o mes en <directorio>/<periodo>.csv, con un manifest.json."""
+
+    SIN_FECHA = "sin_fecha"
+    PODA_POR_FECHA = True
+
+    def __init__(self, directorio, por_mes=False):
+        self.directorio = directorio
+        self.por_mes = por_mes
+        self.ruta_manifest = os.path.join(directorio, "manifest.json")
+        self._particiones = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(directorio, exist_ok=True)
+
+    def _claves(self, fechas):
+        """Partición de cada fila según su fecha ('2025', '2025-03' o 'sin_fecha')."""
+        fechas = pd.to_datetime(fechas, errors='coerce')
+        return fechas.dt.strftime("%Y-%m" if self.por_mes else "%Y").fillna(self.SIN_FECHA)
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.csv")
+
+    def _manifest(self):
+        try:
+            with open(self.ruta_manifest, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'particiones': {}, 'siguiente_id': 1}
+
+    def _guardar_manifest(self, manifest):
+        tmp = self.ruta_manifest + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.ruta_manifest)
+
+    def _guardar_particion(self, manifest, clave, df):
+        """Reescribe una partición y actualiza su entrada del manifest (la borra si quedó vacía)."""
+        ruta = self._ruta(clave)
+        if df.empty:
+            manifest['particiones'].pop(clave, None)
+            if os.path.exists(ruta):
+                os.remove(ruta)
+            return
+
+        for col in [ID_COL] + COLUMNAS_MANTENCIONES:
+            if col not in df.columns:
+                df[col] = None
+        reescribir_csv(ruta, df[[ID_COL] + COLUMNAS_MANTENCIONES])
+
+        fechas = pd.to_datetime(df['Fecha'], errors='coerce')
+        manifest['particiones'][clave] = {
+            'archivo': os.path.basename(ruta),
+            'desde': fechas.min().date().isoformat() if fechas.notna().any() else None,
+            'hasta': fechas.max().date().isoformat() if fechas.notna().any() else None,
+            'filas': len(df)
+        }
+
+    def _leer_particion(self, clave, info):
+        ruta = os.path.join(self.directorio, info['archivo'])
+        st = os.stat(ruta)
+        firma = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            guardada = self._particiones.get(clave)
+        if guardada and guardada[0] == firma:
+            return guardada[1]
+
+        df = pd.read_csv(ruta)
+        with self._lock:
+            self._particiones[clave] = (firma, df)
+        return df
 
+    def _leer(self, claves=None):
+        with bloqueo_archivo(self.ruta_manifest, compartido=True):
+            manifest = self._manifest()
+            partes = [
+                self._leer_particion(clave, info)
+                for clave, info in sorted(manifest['particiones'].items())
+                if claves is None or clave in claves
+            ]
+        if not partes:
+            return pd.DataFrame()
+        # Orden de inserción, igual que el CSV único
+        return pd.concat(partes, ignore_index=True).sort_values(ID_COL, kind='stable').reset_index(drop=True)
+
+    def particiones_en_rango(self, fecha_desde=None, fecha_hasta=None):
+        """Claves de las particiones cuyo rango [desde, hasta] se cruza con el pedido."""
+        claves = []
+        for clave, info in self._manifest()['particiones'].items():
+            if info['desde'] is None:
+                continue
+            if fecha_desde and info['hasta'] < fecha_desde.isoformat():
+                continue
+            if fecha_hasta and info['desde'] > fecha_hasta.isoformat():
+                continue
+            claves.append(clave)
+        return claves
+
+    def firma(self):
+        """(mtime, tamaño) del manifest: toda escritura lo actualiza."""
+        try:
+            st = os.stat(self.ruta_manifest)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def modificado(self):
+        """Fecha de la última escritura (mtime del manifest), o None si no hay datos."""
+        firma = self.firma()
+        return firma[0] / 1e9 if firma else None
+
+    def leer(self):
+        return self._leer()
+
+    def escribir(self, df):
+        df = serializar_mantenciones(asegurar_ids(df))
+        with bloqueo_archivo(self.ruta_manifest):
+            anterior = self._manifest()
+            manifest = {'particiones': {}, 'siguiente_id': siguiente_id(df)}
+            if not df.empty:
+                for clave, grupo in df.groupby(self._claves(df['Fecha']), sort=True):
+                    self._guardar_particion(manifest, clave, grupo)
+            for clave in set(anterior['particiones']) - set(manifest['particiones']):
+                os.remove(self._ruta(clave))
+            self._guardar_manifest(manifest)
+
+    def ultima_escritura(self):
+        """Firmas antes/después de la última escritura de este hilo (ver AlmacenCSV.ultima_escritura)."""
+        return getattr(self._local, 'ultima', None)
+
+    def _anotar_escritura(self, firma_antes):
+        # Con el lock del manifest tomado nadie más escribe entre las dos firmas
+        self._local.ultima = {'antes': firma_antes, 'despues': self.firma(), 'exclusiva': True}
+
+    def agregar(self, fila):
+        """Append de la fila en la partición de su fecha; devuelve el ID asignado."""
+        self._local.ultima = None
+        with bloqueo_archivo(self.ruta_manifest):
+            firma_antes = self.firma()
+            manifest = self._manifest()
+            id_nuevo = manifest.get('siguiente_id', 1)
+            fila = dict(fila, **{ID_COL: id_nuevo})
+            clave = self._claves(pd.Series([fila.get('Fecha')])).iloc[0]
+            info = manifest['particiones'].get(clave)
+
+            if info is None:
+                self._guardar_particion(manifest, clave, pd.DataFrame([fila]))
+            else:
+                ruta = self._ruta(clave)
+                agregar_filas_csv(ruta, encabezado_csv(ruta), [fila])
+                fecha = str(fila.get('Fecha') or '')[:10]
+                if clave != self.SIN_FECHA:
+                    info['desde'] = min(info['desde'], fecha)
+                    info['hasta'] = max(info['hasta'], fecha)
+                info['filas'] += 1
+
+            manifest['siguiente_id'] = id_nuevo + 1
+            self._guardar_manifest(manifest)
+            self._anotar_escritura(firma_antes)
+        return id_nuevo
+
+    def _modificar(self, id_registro, cambios=None):
+        """Edita (cambios) o borra (cambios=None) un registro reescribiendo solo sus particiones."""
+        self._local.ultima = None
+        with bloqueo_archivo(self.ruta_manifest):
+            firma_antes = self.firma()
+            fila = obtener_mantencion(id_registro)
+            if fila is None:
+                return False
+            manifest = self._manifest()
+            clave = self._claves(pd.Series([fila['Fecha']])).iloc[0]
+            if clave not in manifest['particiones']:
+                return False
+
+            particion = self._leer_particion(clave, manifest['particiones'][clave])
+            mascara = particion[ID_COL] == id_registro
+            registro = particion[mascara]
+            particion = particion[~mascara]
+
+            if cambios is not None:
+                registro = registro.astype({col: object for col in cambios if col in registro.columns})
+                for col, valor in cambios.items():
+                    registro[col] = valor
+                clave_nueva = self._claves(registro['Fecha']).iloc[0]
+                if clave_nueva == clave:
+                    particion = pd.concat([particion, registro]).sort_values(ID_COL, kind='stable')
+                else:
+                    destino = manifest['particiones'].get(clave_nueva)
+                    previo = self._leer_particion(clave_nueva, destino) if destino else pd.DataFrame()
+                    self._guardar_particion(
+                        manifest, clave_nueva,
+                        pd.concat([previo, registro]).sort_values(ID_COL, kind='stable')
+                    )
+
+            self._guardar_particion(manifest, clave, particion)
+            self._guardar_manifest(manifest)
+            self._anotar_escritura(firma_antes)
+        return True
+
+    def actualizar(self, id_registro, cambios):
+        return self._modificar(id_registro, cambios)
+
+    def eliminar(self, id_registro):
+        return self._modificar(id_registro)
+
+    def consultar(self, maquina=None, responsable=None, fecha_desde=None, fecha_hasta=None):
+        """Lee solo las particiones del rango pedido y filtra sobre ellas; None sin filtros."""
+        if not any((maquina, responsable, fecha_desde, fecha_hasta)):
+            return None
+        df = self._leer(self.particiones_en_rango(fecha_desde, fecha_hasta))
+        if df.empty:
+            return df
+
+        df = normalizar_mantenciones(df)
+        fechas = pd.to_datetime(df['Fecha'], errors='coerce')
+        mascara = fechas.notna()
+        if maquina:
+            mascara &= df['Máquina'] == maquina
+        if responsable:
+            mascara &= df['Responsable'] == responsable
+        if fecha_desde:
+            mascara &= fechas >= pd.Timestamp(fecha_desde)
+        if fecha_hasta:
+            mascara &= fechas < pd.Timestamp(fecha_hasta) + pd.Timedelta(days=1)
+        return df[mascara]
+
+
+_almacen = None
+
+
+def obtener_almacen():
+    """Backend de mantenciones según MANTENCIONES_BACKEND: 'csv' (por defecto), 'sqlite' o 'particionado'."""
+    global _almacen
+    if _almacen is None:
+        backend = os.getenv("MANTENCIONES_BACKEND", "csv").strip().lower()
+        if backend == "sqlite":
+            _almacen = AlmacenSQLite(os.getenv("MANTENCIONES_DB", "mantenciones.db"))
+        elif backend == "particionado":
+            _almacen = AlmacenParticionado(
+                os.getenv("MANTENCIONES_DIR", "mantenciones_particiones"),
+                por_mes=os.getenv("MANTENCIONES_PARTICION", "anual").strip().lower() == "mensual"
+            )
+        else:
+            _almacen = AlmacenCSV(MANTENCIONES_FILE)
+    return _almacen
+
+
+# ===================== MANTENCIONES =====================
+
+# Con copy-on-write las vistas que entrega la caché se copian solas al
+# modificarse, así ninguna ruta puede alterar el DataFrame compartido.
+# (pandas 3 ya lo trae activado por defecto)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+_cache_mantenciones = {'firma': None, 'df': None, 'posiciones': None, 'lectura': None, 'filtros': None}
+_cache_lock = threading.Lock()
+_version_escrituras = 0
+
+
+def firma_mantenciones():
+    """Versión de los datos: firma del backend y escrituras de este proceso (None si no hay datos)."""
+    firma = obtener_almacen().firma()
+    if firma is None:
+        return None
+    return (firma, _version_escrituras)
+
+
+def firma_escritura(firma_antes):
+    """Firma tras la escritura de este hilo si fue el único cambio desde firma_antes; si no, None."""
+    ultima = obtener_almacen().ultima_escritura()
+    if firma_antes is None or ultima is None or not ultima['exclusiva'] or ultima['antes'] != firma_antes[0]:
+        return None
+    if _version_escrituras != firma_antes[1] + 1:
+        return None
+    return (ultima['despues'], _version_escrituras)
+
+
+def normalizar_mantenciones(df):
+    """Normaliza Máquinas y Responsables (primera letra mayúscula)."""
     for col in ['Máquina', 'Responsable']:
         if col in df.columns:
             df[col] = (
@@ -69,56 +897,1024 @@ def cargar_mantenciones():
     return df
 
 
-def aplicar_filtros(df, maquina=None, responsable=None, fecha_desde=None, fecha_hasta=None):
-    """
-    Aplica filtros sobre el DataFrame de mantenciones.
-    Todos los parámetros son opcionales.
-    """
-    if df.empty:
-        return df
+# Tipos en memoria de cada columna: se aplican una sola vez al cargar, así las
+# rutas trabajan con fechas/horas ya parseadas y categorías en vez de textos.
+ESQUEMA_MANTENCIONES = {
+    'Máquina': 'category',
+    'Responsable': 'category',
+    'Tipo': 'category',
+    'Fecha': 'datetime64',
+    'Próximo_mantenimiento': 'datetime64',
+    'Hora_inicio': 'timedelta64',
+    'Hora_fin': 'timedelta64',
+    'Duración_horas': 'float32',
+    'Frecuencia_dias': 'Int16',
+}
+
+# Frecuencia máxima de un preventivo (10 años): cabe en el Int16 del esquema
+FRECUENCIA_MAX_DIAS = 3650
+
+
+def parsear_horas(serie):
+    """Horas 'HH:MM' (o 'HH:MM:SS') a timedelta64 desde medianoche; NaT si no se pueden leer."""
+    if pd.api.types.is_timedelta64_dtype(serie):
+        return serie
+    # Un día tiene a lo sumo 1440 horas 'HH:MM' distintas: se parsea cada valor
+    # distinto una sola vez y el resultado se reparte con los códigos.
+    codigos, unicas = pd.factorize(serie)
+    texto = pd.Series(unicas, dtype=object).astype('string').str.strip()
+    horas = pd.to_datetime(texto, format='%H:%M', errors='coerce')
+    faltan = horas.isna() & texto.notna()
+    if faltan.any():
+        horas[faltan] = pd.to_datetime(texto[faltan], format='%H:%M:%S', errors='coerce')
+    delta = (horas - horas.dt.normalize()).to_numpy()
+    # Código -1 (vacío) apunta al NaT agregado al final
+    delta = np.append(delta, np.array(['NaT'], dtype=delta.dtype))
+    return pd.Series(delta[codigos], index=serie.index)
+
+
+def formatear_horas(serie):
+    """timedelta64 a texto 'HH:MM' (None donde no hay hora), una vez por valor distinto."""
+    codigos, unicos = pd.factorize(serie)
+    minutos = (unicos.total_seconds() // 60).astype(int)
+    textos = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in minutos] + [None], dtype=object)
+    return pd.Series(textos[codigos], index=serie.index, dtype=object)
+
+
+def horas_float(serie):
+    """Duración float32 a float64 sin ruido de representación (2.3 y no 2.2999999523)."""
+    return serie.astype('float64').round(4)
+
+
+def tipar_mantenciones(df):
+    """Aplica ESQUEMA_MANTENCIONES a las columnas presentes (los valores ilegibles quedan NaT/NaN)."""
+    for col, tipo in ESQUEMA_MANTENCIONES.items():
+        if col not in df.columns:
+            continue
+        serie = df[col]
+        if tipo == 'category':
+            if not isinstance(serie.dtype, pd.CategoricalDtype):
+                df[col] = serie.astype('category')
+        elif tipo.startswith('datetime'):
+            if not pd.api.types.is_datetime64_dtype(serie):
+                df[col] = pd.to_datetime(serie, errors='coerce')
+        elif tipo.startswith('timedelta'):
+            df[col] = parsear_horas(serie)
+        elif serie.dtype != tipo:
+            numeros = pd.to_numeric(serie, errors='coerce')
+            if tipo == 'Int16':
+                # Un valor guardado fuera de rango queda <NA> en vez de impedir la carga
+                numeros = numeros.round().where(numeros.abs() <= np.iinfo(np.int16).max)
+            df[col] = numeros.astype(tipo)
+    return df
+
+
+def serializar_mantenciones(df):
+    """Inverso de tipar_mantenciones: columnas como texto/números, tal como se guardan."""
+    df = df.copy(deep=False)
+    for col in df.columns:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            df[col] = serie.astype(object)
+        elif pd.api.types.is_datetime64_dtype(serie):
+            df[col] = serie.dt.strftime('%Y-%m-%d').astype(object).where(serie.notna(), None)
+        elif pd.api.types.is_timedelta64_dtype(serie):
+            df[col] = formatear_horas(serie)
+        elif serie.dtype == 'float32':
+            df[col] = horas_float(serie)
+    return df
+
+
+def inicio_fin(df):
+    """Inicio y fin de cada intervención como datetime64; el fin pasa al día siguiente si cruza la medianoche."""
+    inicio = df['Fecha'] + df['Hora_inicio']
+    fin = df['Fecha'] + df['Hora_fin']
+    fin = fin.mask(df['Hora_fin'] < df['Hora_inicio'], fin + pd.Timedelta(days=1))
+    return inicio, fin
+
+
+def horas_parada(df):
+    """Horas de parada de cada intervención (NaN si le falta la hora de inicio o de fin)."""
+    if 'Hora_inicio' not in df.columns or 'Hora_fin' not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    inicio, fin = inicio_fin(df)
+    return (fin - inicio).dt.total_seconds() / 3600.0
+
+
+def union_intervalos(grupos, inicio, fin):
+    """Horas que cada intervalo agrega a la unión de paradas de su grupo, en el orden recibido."""
+    inicio = np.asarray(inicio, dtype=np.int64)
+    fin = np.asarray(fin, dtype=np.int64)
+    if len(inicio) == 0:
+        return np.zeros(0)
+
+    origen = inicio.min()
+    salto = int(fin.max() - origen) + 1
+    desplazamiento = np.asarray(grupos, dtype=np.int64) * salto
+    inicio = inicio - origen + desplazamiento
+    fin = np.maximum(fin - origen + desplazamiento, inicio)
+
+    orden = np.argsort(inicio, kind='stable')
+    inicio, fin = inicio[orden], fin[orden]
+    cubierto = np.concatenate(([inicio[0]], np.maximum.accumulate(fin)[:-1]))
+    aporte = np.maximum(fin - np.maximum(inicio, cubierto), 0)
+
+    horas = np.empty(len(aporte))
+    horas[orden] = aporte / 3600.0
+    return horas
+
+
+def concatenar_mantenciones(anterior, nuevo):
+    """Agrega filas ya tipadas al final sin recodificar las categorías existentes."""
+    for col in anterior.columns:
+        if isinstance(anterior[col].dtype, pd.CategoricalDtype) and col in nuevo.columns:
+            faltan = nuevo[col].cat.categories.difference(anterior[col].cat.categories)
+            if len(faltan):
+                anterior[col] = anterior[col].cat.add_categories(faltan)
+            nuevo[col] = nuevo[col].cat.set_categories(anterior[col].cat.categories)
+    return pd.concat([anterior, nuevo], ignore_index=True)
+
+
+def cargar_mantenciones_indexadas():
+    """(mantenciones, índice ID -> posición) desde la caché del proceso, releída al cambiar la firma."""
+    firma = firma_mantenciones()
+    if firma is None:
+        return pd.DataFrame(), pd.Index([])
+
+    with _cache_lock:
+        if _cache_mantenciones['firma'] == firma:
+            return _cache_mantenciones['df'].copy(deep=False), _cache_mantenciones['posiciones']
+        anterior = _cache_mantenciones['df']
+        lectura = _cache_mantenciones['lectura']
+
+    # La lectura se hace fuera del lock de la caché: un escritor que tiene el
+    # lock del archivo también necesita cargar datos.
+    almacen = obtener_almacen()
+    if isinstance(almacen, AlmacenCSV):
+        nuevo, lectura, solo_cola = almacen.leer_incremental(lectura if anterior is not None else None)
+        nuevo = tipar_mantenciones(normalizar_mantenciones(nuevo))
+        if solo_cola:
+            df = concatenar_mantenciones(anterior.copy(deep=False), nuevo) if not nuevo.empty else anterior
+        else:
+            df = nuevo
+    else:
+        df = tipar_mantenciones(normalizar_mantenciones(almacen.leer()))
+        lectura = None
 
-    # Normalizar valores de filtros
+    df = asegurar_ids(df)
+    posiciones = pd.Index(df[ID_COL]) if ID_COL in df.columns else pd.Index([])
+
+    with _cache_lock:
+        _cache_mantenciones.update(df=df, posiciones=posiciones, firma=firma, lectura=lectura, filtros=None)
+
+    return df.copy(deep=False), posiciones
+
+
+def cache_vigente():
+    """True si la caché del proceso corresponde a la firma actual del almacén."""
+    firma = firma_mantenciones()
+    with _cache_lock:
+        return firma is not None and _cache_mantenciones['firma'] == firma
+
+
+def cargar_mantenciones():
+    """Mantenciones normalizadas (vista de la caché, ver cargar_mantenciones_indexadas)."""
+    return cargar_mantenciones_indexadas()[0]
+
+
+def _posicion(posiciones, id_registro):
+    """Posición de un ID en el DataFrame de la caché (búsqueda hash O(1)), o None."""
+    try:
+        return posiciones.get_loc(id_registro)
+    except KeyError:
+        return None
+
+
+def obtener_mantencion(id_registro):
+    """Registro con ese ID como Series, o None si no existe."""
+    df, posiciones = cargar_mantenciones_indexadas()
+    pos = _posicion(posiciones, id_registro)
+    return None if pos is None else df.iloc[pos]
+
+
+def _invalidar_cache():
+    """Marca la caché como desactualizada; el DataFrame queda para la lectura incremental."""
+    global _version_escrituras
+    with _cache_lock:
+        _version_escrituras += 1
+        _cache_mantenciones['firma'] = None
+    # Las vistas guardadas son de la versión anterior: se liberan de inmediato
+    cache_vistas.limpiar()
+
+
+def guardar_mantenciones(df):
+    """Reemplaza todas las mantenciones del backend e invalida la caché."""
+    obtener_almacen().escribir(df)
+    _invalidar_cache()
+
+
+def _registro_tipado(id_registro):
+    """Registro con ese ID como DataFrame de una fila (conserva los tipos), o None."""
+    df, posiciones = cargar_mantenciones_indexadas()
+    pos = _posicion(posiciones, id_registro)
+    return None if pos is None else df.iloc[[pos]]
+
+
+def insertar_mantencion(fila):
+    """Agrega un registro (dict columna -> valor) y devuelve su ID."""
+    firma_antes = firma_mantenciones()
+    id_registro = obtener_almacen().agregar(fila)
+    _invalidar_cache()
+    firma_despues = firma_escritura(firma_antes)
+    nuevo = tipar_mantenciones(normalizar_mantenciones(pd.DataFrame([dict(fila, **{ID_COL: id_registro})])))
+    actualizar_agregados(None, nuevo, firma_antes, firma_despues)
+    actualizar_vencimientos(None, nuevo, firma_antes, firma_despues)
+    return id_registro
+
+
+def actualizar_mantencion(id_registro, cambios):
+    """Modifica las columnas indicadas de un registro. False si no existe."""
+    firma_antes = firma_mantenciones()
+    antes = _registro_tipado(id_registro)
+    ok = obtener_almacen().actualizar(id_registro, cambios)
+    _invalidar_cache()
+    firma_despues = firma_escritura(firma_antes) if ok else None
+
+    despues = None
+    if ok and antes is not None:
+        despues = serializar_mantenciones(antes)
+        for col, valor in cambios.items():
+            despues[col] = valor
+        despues = tipar_mantenciones(normalizar_mantenciones(despues))
+    else:
+        antes = None
+    actualizar_agregados(antes, despues, firma_antes, firma_despues)
+    actualizar_vencimientos(antes, despues, firma_antes, firma_despues)
+    return ok
+
+
+def eliminar_mantencion(id_registro):
+    """Elimina un registro. False si no existe."""
+    firma_antes = firma_mantenciones()
+    antes = _registro_tipado(id_registro)
+    ok = obtener_almacen().eliminar(id_registro)
+    _invalidar_cache()
+    firma_despues = firma_escritura(firma_antes) if ok else None
+    actualizar_agregados(antes if ok else None, None, firma_antes, firma_despues)
+    actualizar_vencimientos(antes if ok else None, None, firma_antes, firma_despues)
+    return ok
+
+
+def _normalizar_filtros(maquina=None, responsable=None, fecha_desde=None, fecha_hasta=None):
+    """Convierte los filtros de la URL a (máquina, responsable, desde, hasta) o None."""
     if maquina and maquina not in ["Todas", "todos"]:
         maquina = normalizar_texto(maquina)
     else:
-        maquina = "Todas"
+        maquina = None
 
     if responsable and responsable not in ["Todos", "todos"]:
         responsable = normalizar_texto(responsable)
     else:
-        responsable = "Todos"
+        responsable = None
+
+    fechas = []
+    for valor in (fecha_desde, fecha_hasta):
+        try:
+            fechas.append(datetime.strptime(valor, "%Y-%m-%d").date() if valor else None)
+        except ValueError:
+            fechas.append(None)
+
+    return maquina, responsable, fechas[0], fechas[1]
 
-    # Asegurar tipo fecha
+
+def consultar_mantenciones(maquina=None, responsable=None, fecha_desde=None, fecha_hasta=None):
+    """Mantenciones filtradas, desde el backend (poda o caché vencida) o con el IndiceFiltros de la caché."""
+    filtros = _normalizar_filtros(maquina, responsable, fecha_desde, fecha_hasta)
+    almacen = obtener_almacen()
+    df = None
+    if ((filtros[2] or filtros[3]) and almacen.PODA_POR_FECHA) or (any(filtros) and not cache_vigente()):
+        df = almacen.consultar(*filtros)
+    if df is None:
+        df, indice = cargar_con_indice_filtros()
+        return df.iloc[indice.filas(*filtros)] if indice is not None else df
+
+    df = tipar_mantenciones(normalizar_mantenciones(df))
     if 'Fecha' in df.columns:
-        df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
         df = df.dropna(subset=['Fecha'])
+    return df
 
-    df_filtrado = df.copy()
 
-    # Filtro por máquina
-    if maquina != "Todas" and 'Máquina' in df_filtrado.columns:
-        df_filtrado = df_filtrado[df_filtrado['Máquina'] == maquina]
+class IndiceFiltros:
+    """Posiciones de la caché ordenadas por fecha, en total y por máquina, para filtrar en O(log n + k)."""
 
-    # Filtro por responsable
-    if responsable != "Todos" and 'Responsable' in df_filtrado.columns:
-        df_filtrado = df_filtrado[df_filtrado['Responsable'] == responsable]
+    def __init__(self, df):
+        self.origen = df
+        self.total = len(df)
+        if df.empty or 'Fecha' not in df.columns:
+            self.por_fecha = np.zeros(0, dtype=np.int64)
+            self.fechas = np.zeros(0, dtype='datetime64[ns]')
+            self.por_maquina, self.fechas_maquina, self.tramos = self.por_fecha, self.fechas, {}
+            self.responsables, self.codigos_responsable = {}, None
+            return
 
-    # Filtro por fechas
-    if fecha_desde:
-        try:
-            f_desde = datetime.strptime(fecha_desde, "%Y-%m-%d").date()
-            df_filtrado = df_filtrado[df_filtrado['Fecha'].dt.date >= f_desde]
-        except ValueError:
-            pass
+        fechas = df['Fecha'].to_numpy()
+        validas = np.flatnonzero(~np.isnat(fechas))
+        self.por_fecha = validas[np.argsort(fechas[validas], kind='stable')]
+        self.fechas = fechas[self.por_fecha]
 
-    if fecha_hasta:
-        try:
-            f_hasta = datetime.strptime(fecha_hasta, "%Y-%m-%d").date()
-            df_filtrado = df_filtrado[df_filtrado['Fecha'].dt.date <= f_hasta]
-        except ValueError:
-            pass
+        # Orden estable por máquina sobre el orden por fecha: cada máquina queda en un tramo ya ordenado por fecha
+        self.tramos = {}
+        self.por_maquina, self.fechas_maquina = self.por_fecha, self.fechas
+        if 'Máquina' in df.columns:
+            codigos, maquinas = pd.factorize(df['Máquina'])
+            codigos = codigos[self.por_fecha]
+            orden = np.argsort(codigos, kind='stable')
+            self.por_maquina = self.por_fecha[orden]
+            self.fechas_maquina = self.fechas[orden]
+            limites = np.searchsorted(codigos[orden], np.arange(len(maquinas) + 1))
+            self.tramos = {maquina: (limites[i], limites[i + 1]) for i, maquina in enumerate(maquinas)}
+
+        self.responsables, self.codigos_responsable = {}, None
+        if 'Responsable' in df.columns:
+            self.codigos_responsable, responsables = pd.factorize(df['Responsable'])
+            self.responsables = {responsable: i for i, responsable in enumerate(responsables)}
+
+    def _limite(self, fecha):
+        """Fecha (date) como datetime64 de la misma unidad que el índice."""
+        return np.datetime64(fecha, 'D').astype(self.fechas.dtype)
+
+    def filas(self, maquina=None, responsable=None, f_desde=None, f_hasta=None):
+        """Posiciones que cumplen los filtros (ya normalizados, ver _normalizar_filtros)."""
+        if maquina:
+            if maquina not in self.tramos:
+                return np.zeros(0, dtype=np.int64)
+            inicio, fin = self.tramos[maquina]
+            posiciones, fechas = self.por_maquina[inicio:fin], self.fechas_maquina[inicio:fin]
+        else:
+            posiciones, fechas = self.por_fecha, self.fechas
+
+        inicio = np.searchsorted(fechas, self._limite(f_desde)) if f_desde else 0
+        fin = (
+            np.searchsorted(fechas, self._limite(f_hasta + timedelta(days=1)))
+            if f_hasta else len(fechas)
+        )
+        posiciones = posiciones[inicio:fin]
+
+        if responsable:
+            if responsable not in self.responsables:
+                return np.zeros(0, dtype=np.int64)
+            posiciones = posiciones[self.codigos_responsable[posiciones] == self.responsables[responsable]]
+
+        if not maquina and not responsable and len(posiciones) == self.total:
+            return slice(None)
+        return np.sort(posiciones)
+
+
+def cargar_con_indice_filtros():
+    """(mantenciones, IndiceFiltros) de una misma versión de la caché."""
+    if cargar_mantenciones_indexadas()[0].empty:
+        return pd.DataFrame(), None
+    with _cache_lock:
+        df = _cache_mantenciones['df']
+        indice = _cache_mantenciones['filtros']
 
-    return df_filtrado
+    if indice is None or indice.origen is not df:
+        indice = IndiceFiltros(df)
+        with _cache_lock:
+            if _cache_mantenciones['df'] is df:
+                _cache_mantenciones['filtros'] = indice
+    return df.copy(deep=False), indice
+
+
+# ===================== SEMÁFORO DE PREVENTIVOS =====================
+
+# Días de anticipación con que un preventivo pasa a "Próximo"
+DIAS_AVISO_PREVENTIVO = 7
+
+
+def semaforo_preventivos(df, hoy=None):
+    """(días que faltan, estado Vencido/Hoy/Próximo/OK) de cada registro, alineados con df.index."""
+    if df.empty or 'Tipo' not in df.columns or 'Próximo_mantenimiento' not in df.columns:
+        return pd.Series(np.nan, index=df.index), pd.Series("", index=df.index, dtype=object)
+
+    hoy = np.datetime64(hoy or datetime.now().date(), 'D')
+    proximo = df['Próximo_mantenimiento'].to_numpy().astype('datetime64[D]')
+    aplica = (df['Tipo'] == 'Preventivo').to_numpy(dtype=bool, na_value=False) & ~np.isnat(proximo)
+    dias = np.where(aplica, (proximo - hoy) / np.timedelta64(1, 'D'), np.nan)
+
+    estado = np.select(
+        [~aplica, dias < 0, dias == 0, dias <= DIAS_AVISO_PREVENTIVO],
+        ["", "Vencido", "Hoy", "Próximo"],
+        default="OK"
+    )
+    return pd.Series(dias, index=df.index), pd.Series(estado, index=df.index, dtype=object)
+
+
+def _dia(fecha):
+    """Fecha como número de día (entero), para ordenar y restar sin objetos datetime."""
+    return int(np.datetime64(fecha, 'D').astype(np.int64))
+
+
+class IndiceVencimientos:
+    """Preventivos como lista ordenada de (día de Próximo_mantenimiento, ID), consultable por rango."""
+
+    def __init__(self):
+        self.claves = []
+
+    def __len__(self):
+        return len(self.claves)
+
+    @staticmethod
+    def _preventivos(df):
+        """(días, IDs) de los preventivos con próximo mantenimiento."""
+        if df.empty or not {'Tipo', 'Próximo_mantenimiento', ID_COL}.issubset(df.columns):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        proximo = df['Próximo_mantenimiento'].to_numpy().astype('datetime64[D]')
+        aplica = (df['Tipo'] == 'Preventivo').to_numpy(dtype=bool, na_value=False) & ~np.isnat(proximo)
+        return proximo[aplica].astype(np.int64), df[ID_COL].to_numpy()[aplica].astype(np.int64)
+
+    @classmethod
+    def desde_df(cls, df):
+        """Construcción completa a partir de las mantenciones tipadas."""
+        indice = cls()
+        dias, ids = cls._preventivos(df)
+        orden = np.lexsort((ids, dias))
+        indice.claves = list(zip(dias[orden].tolist(), ids[orden].tolist()))
+        return indice
+
+    def sumar(self, registros, signo=1):
+        """Agrega (signo=1) o quita (signo=-1) registros tipados (DataFrame)."""
+        if registros is None:
+            return
+        for clave in zip(*(a.tolist() for a in self._preventivos(registros))):
+            if signo > 0:
+                bisect.insort(self.claves, clave)
+            else:
+                pos = bisect.bisect_left(self.claves, clave)
+                if pos < len(self.claves) and self.claves[pos] == clave:
+                    del self.claves[pos]
+
+    def restar(self, registros):
+        self.sumar(registros, signo=-1)
+
+    def rango(self, desde=None, hasta=None):
+        """IDs con próximo mantenimiento entre los días desde y hasta (inclusive), por fecha."""
+        inicio = bisect.bisect_left(self.claves, (desde,)) if desde is not None else 0
+        fin = bisect.bisect_left(self.claves, (hasta + 1,)) if hasta is not None else len(self.claves)
+        return [id_registro for _, id_registro in self.claves[inicio:fin]]
+
+    def contar(self, desde=None, hasta=None):
+        """Cantidad de preventivos en el rango, sin materializar los IDs: O(log n)."""
+        inicio = bisect.bisect_left(self.claves, (desde,)) if desde is not None else 0
+        fin = bisect.bisect_left(self.claves, (hasta + 1,)) if hasta is not None else len(self.claves)
+        return max(fin - inicio, 0)
+
+    def vencidos(self, hoy):
+        return self.rango(hasta=_dia(hoy) - 1)
+
+    def para_hoy(self, hoy):
+        return self.rango(_dia(hoy), _dia(hoy))
+
+    def proximos(self, hoy, dias=DIAS_AVISO_PREVENTIVO):
+        """Vencen entre hoy y dentro de `dias` días (inclusive)."""
+        return self.rango(_dia(hoy), _dia(hoy) + dias)
+
+    def en_ventana(self, desde, hasta):
+        return self.rango(_dia(desde), _dia(hasta))
+
+
+_vencimientos = {'firma': None, 'datos': None, 'pendientes_verificar': 0}
+
+
+def indice_vencimientos():
+    """Índice de vencimientos vigente: se reconstruye si no lo está y se verifica cada tanto."""
+    firma = firma_mantenciones()
+    with _cache_lock:
+        vigente = _vencimientos['datos'] is not None and firma is not None and _vencimientos['firma'] == firma
+        if vigente and _vencimientos['pendientes_verificar'] < VERIFICAR_KPIS_CADA:
+            return _vencimientos['datos']
+
+    if vigente:
+        return verificar_vencimientos()[0]
+
+    indice = IndiceVencimientos.desde_df(cargar_mantenciones())
+    with _cache_lock:
+        _vencimientos.update(firma=firma, datos=indice, pendientes_verificar=0)
+    return indice
+
+
+def actualizar_vencimientos(antes, despues, firma_antes, firma_despues):
+    """Como actualizar_agregados, para el índice de vencimientos."""
+    with _cache_lock:
+        indice = _vencimientos['datos']
+        if indice is None or firma_despues is None or _vencimientos['firma'] != firma_antes:
+            _vencimientos.update(firma=None, datos=None)
+            return
+        indice.restar(antes)
+        indice.sumar(despues)
+        _vencimientos['firma'] = firma_despues
+        _vencimientos['pendientes_verificar'] += 1
+
+
+def verificar_vencimientos():
+    """Reconstruye el índice de vencimientos y devuelve (índice, diferencias con el anterior)."""
+    firma = firma_mantenciones()
+    completo = IndiceVencimientos.desde_df(cargar_mantenciones())
+    with _cache_lock:
+        indice = _vencimientos['datos'] if _vencimientos['firma'] == firma else None
+        claves = set(indice.claves) if indice is not None else None
+
+    diferencias = []
+    if claves is not None:
+        esperadas = set(completo.claves)
+        diferencias = [f"falta ID {i} (día {d})" for d, i in sorted(esperadas - claves)]
+        diferencias += [f"sobra ID {i} (día {d})" for d, i in sorted(claves - esperadas)]
+    if diferencias:
+        app.logger.warning("Índice de vencimientos descuadrado, se reconstruye: %s", "; ".join(diferencias[:5]))
+    with _cache_lock:
+        _vencimientos.update(firma=firma, datos=completo, pendientes_verificar=0)
+    return completo, diferencias
+
+
+def ocurrencias_preventivas(desde=None, hasta=None, hoy=None):
+    """Próximos preventivos y sus repeticiones (los vencidos no se repiten) entre desde y hasta."""
+    df, posiciones = cargar_mantenciones_indexadas()
+    vencimientos = indice_vencimientos()
+    dia_hoy = _dia(hoy or datetime.now().date())
+    # Antes de la ventana solo pueden repetirse hacia ella los que vencen desde hoy
+    minimo = min(_dia(desde), dia_hoy) if desde and hasta else (_dia(desde) if desde else None)
+    ids = np.array(vencimientos.rango(minimo, _dia(hasta) if hasta else None), dtype=np.int64)
+    filas = posiciones.get_indexer(ids) if len(ids) else np.zeros(0, dtype=np.int64)
+    ids, prev = ids[filas >= 0], df.iloc[filas[filas >= 0]]
+    if prev.empty:
+        return pd.DataFrame(columns=[ID_COL, 'Máquina', 'Fecha'])
+
+    proximo = prev['Próximo_mantenimiento'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    inicio = _dia(desde) if desde else np.iinfo(np.int64).min
+    fin = _dia(hasta) if hasta else np.iinfo(np.int64).max
+
+    # El próximo mantenimiento en sí
+    en_ventana = (proximo >= inicio) & (proximo <= fin)
+    partes = [(ids[en_ventana], prev['Máquina'].to_numpy()[en_ventana], proximo[en_ventana])]
+
+    # Repeticiones futuras de los preventivos al día: primera >= max(inicio,
+    # hoy, próximo + paso) y cuántas caben hasta fin. Los vencidos no se repiten.
+    if desde and hasta and 'Frecuencia_dias' in prev.columns:
+        frecuencia = pd.to_numeric(prev['Frecuencia_dias'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        paso = np.nan_to_num(frecuencia).astype(np.int64)
+        con_frecuencia = (paso > 0) & (proximo >= dia_hoy)
+        paso, base, maquinas = paso[con_frecuencia], proximo[con_frecuencia], prev['Máquina'].to_numpy()[con_frecuencia]
+        desde_rep = np.maximum(np.maximum(inicio, dia_hoy), base + paso)
+        primera = base + -(-(desde_rep - base) // paso) * paso
+        cantidad = np.maximum((fin - primera) // paso + 1, 0)
+
+        # Expansión vectorizada: cada preventivo se repite "cantidad" veces, desplazado en pasos
+        origen = np.repeat(np.arange(len(primera)), cantidad)
+        salto = np.arange(len(origen)) - np.repeat(np.cumsum(cantidad) - cantidad, cantidad)
+        partes.append((ids[con_frecuencia][origen], maquinas[origen], primera[origen] + salto * paso[origen]))
+
+    return pd.DataFrame({
+        ID_COL: np.concatenate([p[0] for p in partes]),
+        'Máquina': np.concatenate([p[1] for p in partes]),
+        'Fecha': pd.to_datetime(np.concatenate([p[2] for p in partes]).astype('datetime64[D]'))
+    })
+
+
+# ===================== TABLA PAGINADA =====================
+
+# Registros por página en la tabla de inicio (y tope para page_size)
+POR_PAGINA = int(os.getenv("MANTENCIONES_POR_PAGINA", "50"))
+POR_PAGINA_MAX = 500
+
+COLUMNAS_TABLA = ['ID', 'Máquina', 'Fecha', 'Descripción', 'Responsable', 'Duración_horas', 'Estado_prev']
+
+# Valor de ?sort= -> columna (con "-" delante es descendente)
+ORDEN_TABLA = {
+    'fecha': 'Fecha',
+    'maquina': 'Máquina',
+    'responsable': 'Responsable',
+    'duracion': 'Duración_horas'
+}
+
+
+def _entero(valor, defecto, minimo=1, maximo=None):
+    """Entero desde un parámetro de la URL, acotado; defecto si no es válido."""
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError):
+        return defecto
+    numero = max(numero, minimo)
+    return min(numero, maximo) if maximo else numero
+
+
+def _clave_orden(serie):
+    """Clave numérica (float, NaN para faltantes) que ordena la serie sin objetos Python."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        rangos = np.argsort(np.argsort(serie.cat.categories.astype(str))).astype('float64')
+        codigos = serie.cat.codes.to_numpy()
+        return np.where(codigos >= 0, rangos[codigos], np.nan)
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        valores = serie.to_numpy()
+        return np.where(np.isnat(valores), np.nan, valores.astype(np.int64).astype('float64'))
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.to_numpy(dtype='float64', na_value=np.nan)
+    codigos = pd.factorize(serie, sort=True)[0].astype('float64')
+    return np.where(codigos >= 0, codigos, np.nan)
+
+
+def pagina_mantenciones(df, pagina=1, por_pagina=None, orden=""):
+    """Una página ordenada de la tabla ya filtrada, con su semáforo: dict con registros y paginación."""
+    por_pagina = _entero(por_pagina, POR_PAGINA, maximo=POR_PAGINA_MAX)
+    total = len(df)
+    paginas = max((total + por_pagina - 1) // por_pagina, 1)
+    pagina = _entero(pagina, 1, maximo=paginas)
+
+    orden = (orden or "").strip().lower()
+    columna = ORDEN_TABLA.get(orden.lstrip('-'))
+    if columna is None or columna not in df.columns:
+        orden = ""
+        posiciones = np.arange((pagina - 1) * por_pagina, min(pagina * por_pagina, total))
+    else:
+        clave = _clave_orden(df[columna])
+        if orden.startswith('-'):
+            clave = -clave
+        clave = np.where(np.isnan(clave), np.inf, clave)
+        posiciones = np.argsort(clave, kind='stable')[(pagina - 1) * por_pagina:pagina * por_pagina]
+
+    visibles = df.iloc[posiciones]
+    for col in ['Tipo', 'Próximo_mantenimiento', 'Duración_horas']:
+        if col not in visibles.columns:
+            visibles[col] = None
+    visibles['Dias_restantes_prev'], visibles['Estado_prev'] = semaforo_preventivos(visibles)
+
+    tabla = visibles.reindex(columns=COLUMNAS_TABLA)
+    if 'Fecha' in visibles.columns:
+        tabla['Fecha'] = visibles['Fecha'].dt.strftime('%d-%m-%Y')
+    tabla['Duración_horas'] = horas_float(visibles['Duración_horas'])
+    tabla = tabla.astype(object).where(tabla.notna(), None)
+
+    return {
+        'registros': tabla.to_dict(orient='records'),
+        'total': total,
+        'pagina': pagina,
+        'paginas': paginas,
+        'por_pagina': por_pagina,
+        'orden': orden
+    }
+
+
+# ===================== INDICADORES (MTBF / MTTR / DISPONIBILIDAD) =====================
+
+COLUMNAS_KPI = [
+    'Fallas', 'Correctivos', 'Preventivos', 'MTBF_dias', 'Intervenciones', 'MTTR_horas',
+    'Fecha_inicio', 'Fecha_fin', 'Horas_totales', 'Downtime_total', 'Disponibilidad'
+]
+
+_cache_kpis = {'firma': None, 'kpis': None}
+
+
+def _numero(valor, decimales):
+    """Redondea un indicador escalar; None si no se pudo calcular."""
+    return None if pd.isna(valor) else round(float(valor), decimales)
+
+
+def _columnas_kpi(d):
+    """Duración, tipo, intervalo y horas de parada (unión por máquina) de cada registro como arrays."""
+    tipo = d['Tipo'] if 'Tipo' in d.columns else pd.Series(None, index=d.index, dtype=object)
+    parada = np.full(len(d), np.nan)
+    inicio = fin = np.zeros(len(d), dtype=np.int64)
+    if 'Hora_inicio' in d.columns and 'Hora_fin' in d.columns:
+        serie_inicio, serie_fin = inicio_fin(d)
+        con_horas = (serie_inicio.notna() & serie_fin.notna()).to_numpy()
+        inicio = serie_inicio.to_numpy().astype('datetime64[s]').astype(np.int64)
+        fin = serie_fin.to_numpy().astype('datetime64[s]').astype(np.int64)
+        grupos = pd.factorize(d['Máquina'])[0]
+        parada[con_horas] = union_intervalos(grupos[con_horas], inicio[con_horas], fin[con_horas])
+    return {
+        'duracion': (
+            horas_float(d['Duración_horas']).to_numpy(dtype='float64', na_value=np.nan)
+            if 'Duración_horas' in d.columns else np.full(len(d), np.nan)
+        ),
+        'parada': parada,
+        'inicio': inicio,
+        'fin': fin,
+        'correctivo': (tipo == 'Correctivo').to_numpy(),
+        'preventivo': (tipo == 'Preventivo').to_numpy()
+    }
+
+
+def calcular_kpis(df):
+    """KPIs por máquina ('por_maquina') y globales (mtbf, mttr, disponibilidad) en una pasada vectorizada."""
+    kpis = {
+        'por_maquina': pd.DataFrame(columns=COLUMNAS_KPI, index=pd.Index([], name='Máquina')),
+        'total_mantenimientos': 0,
+        'total_maquinas': 0,
+        'mtbf': None,
+        'mttr': None,
+        'disponibilidad': None
+    }
+    if df.empty or 'Máquina' not in df.columns or 'Fecha' not in df.columns:
+        return kpis
+
+    d = df.dropna(subset=['Máquina', 'Fecha'])
+    if d.empty:
+        return kpis
+    d = d.sort_values(by=['Máquina', 'Fecha'], kind='stable')
+
+    columnas = _columnas_kpi(d)
+    base = pd.DataFrame({
+        'Máquina': d['Máquina'],
+        'Fecha': d['Fecha'],
+        'DifDias': d.groupby('Máquina', observed=True)['Fecha'].diff().dt.days,
+        'Duración': columnas['duracion'],
+        'Parada': columnas['parada'],
+        'Fecha_horas': d['Fecha'].where(~np.isnan(columnas['parada'])),
+        'Correctivo': columnas['correctivo'],
+        'Preventivo': columnas['preventivo']
+    }, index=d.index)
+
+    por_maquina = base.groupby('Máquina', observed=True).agg(
+        Fallas=('Fecha', 'count'),
+        Correctivos=('Correctivo', 'sum'),
+        Preventivos=('Preventivo', 'sum'),
+        MTBF_dias=('DifDias', 'mean'),
+        Intervenciones=('Duración', 'count'),
+        MTTR_horas=('Duración', 'mean'),
+        Fecha_inicio=('Fecha_horas', 'min'),
+        Fecha_fin=('Fecha_horas', 'max'),
+        Downtime_total=('Parada', 'sum')
+    )
+    por_maquina['Horas_totales'] = ((por_maquina['Fecha_fin'] - por_maquina['Fecha_inicio']).dt.days + 1) * 24.0
+    por_maquina['Disponibilidad'] = (
+        (por_maquina['Horas_totales'] - por_maquina['Downtime_total']) / por_maquina['Horas_totales'] * 100
+    ).round(2)
+    por_maquina['MTBF_dias'] = por_maquina['MTBF_dias'].round(1)
+    por_maquina['MTTR_horas'] = por_maquina['MTTR_horas'].round(1)
+    kpis['por_maquina'] = por_maquina[COLUMNAS_KPI]
+
+    kpis['total_mantenimientos'] = len(d)
+    kpis['total_maquinas'] = len(por_maquina)
+    kpis['mtbf'] = _numero(base['DifDias'].mean(), 1)
+    kpis['mttr'] = _numero(base['Duración'].mean(), 1)
+
+    con_horas = base['Fecha_horas'].dropna()
+    if not con_horas.empty:
+        horas_totales = ((con_horas.max() - con_horas.min()).days + 1) * 24
+        kpis['disponibilidad'] = _numero((horas_totales - base['Parada'].sum()) / horas_totales * 100, 2)
+
+    return kpis
+
+
+def indicadores_mantenciones():
+    """KPIs del historial completo, desde los acumulados por máquina (AgregadosKPI)."""
+    firma = firma_mantenciones()
+    with _cache_lock:
+        if firma is not None and _cache_kpis['firma'] == firma:
+            return _cache_kpis['kpis']
+        # Una escritura concurrente puede vaciar _agregados: se sigue con esta referencia
+        agregados = _agregados['datos'] if firma is not None and _agregados['firma'] == firma else None
+        verificar = agregados is not None and _agregados['pendientes_verificar'] >= VERIFICAR_KPIS_CADA
+
+    if verificar:
+        agregados = verificar_agregados()[0]
+    if agregados is None:
+        agregados = AgregadosKPI.desde_df(cargar_mantenciones())
+        with _cache_lock:
+            _agregados.update(firma=firma, datos=agregados, pendientes_verificar=0)
+
+    with _cache_lock:
+        kpis = agregados.kpis()
+        if _agregados['datos'] is agregados and _agregados['firma'] == firma:
+            _cache_kpis.update(firma=firma, kpis=kpis)
+    return kpis
+
+
+# Cada cuántas actualizaciones incrementales se contrastan los acumulados con el cálculo completo
+VERIFICAR_KPIS_CADA = int(os.getenv("MANTENCIONES_VERIFICAR_KPIS", "200"))
+
+_agregados = {'firma': None, 'datos': None, 'pendientes_verificar': 0}
+
+
+class AgregadosKPI:
+    """Acumulados por máquina para los KPI, actualizables registro a registro."""
+
+    def __init__(self):
+        self.maquinas = {}
+
+    @classmethod
+    def desde_df(cls, df):
+        """Reconstrucción completa a partir de las mantenciones tipadas."""
+        agregados = cls()
+        if df.empty or 'Máquina' not in df.columns or 'Fecha' not in df.columns:
+            return agregados
+
+        d = df.dropna(subset=['Máquina', 'Fecha']).sort_values(by=['Máquina', 'Fecha'], kind='stable')
+        columnas = _columnas_kpi(d)
+        dias = d['Fecha'].to_numpy().astype('datetime64[D]').astype(np.int64)
+
+        for maquina, posiciones in d.groupby('Máquina', observed=True).indices.items():
+            parada = columnas['parada'][posiciones]
+            duracion = columnas['duracion'][posiciones]
+            con_horas = ~np.isnan(parada)
+            agregados.maquinas[maquina] = {
+                'dias': dias[posiciones].tolist(),
+                'dias_horas': dias[posiciones][con_horas].tolist(),
+                'intervalos': list(zip(
+                    columnas['inicio'][posiciones][con_horas].tolist(),
+                    columnas['fin'][posiciones][con_horas].tolist()
+                )),
+                'correctivos': int(columnas['correctivo'][posiciones].sum()),
+                'preventivos': int(columnas['preventivo'][posiciones].sum()),
+                'n_duracion': int((~np.isnan(duracion)).sum()),
+                'suma_duracion': float(np.nansum(duracion)),
+                'parada': float(parada[con_horas].sum())
+            }
+        return agregados
+
+    def sumar(self, registros, signo=1):
+        """Suma (signo=1) o resta (signo=-1) registros tipados (DataFrame) a los acumulados."""
+        if registros is None or registros.empty or 'Fecha' not in registros.columns:
+            return
+        registros = registros.dropna(subset=['Máquina', 'Fecha'])
+        columnas = _columnas_kpi(registros)
+
+        for i, (maquina, fecha) in enumerate(zip(registros['Máquina'], registros['Fecha'])):
+            acumulado = self.maquinas.setdefault(maquina, {
+                'dias': [], 'dias_horas': [], 'intervalos': [], 'correctivos': 0, 'preventivos': 0,
+                'n_duracion': 0, 'suma_duracion': 0.0, 'parada': 0.0
+            })
+            dia = _dia(fecha)
+            duracion = columnas['duracion'][i]
+            parada = columnas['parada'][i]
+
+            if signo > 0:
+                bisect.insort(acumulado['dias'], dia)
+            else:
+                del acumulado['dias'][bisect.bisect_left(acumulado['dias'], dia)]
+            acumulado['correctivos'] += signo * int(columnas['correctivo'][i])
+            acumulado['preventivos'] += signo * int(columnas['preventivo'][i])
+            if not np.isnan(duracion):
+                acumulado['n_duracion'] += signo
+                acumulado['suma_duracion'] += signo * float(duracion)
+            if not np.isnan(parada):
+                intervalo = (int(columnas['inicio'][i]), int(columnas['fin'][i]))
+                if signo > 0:
+                    bisect.insort(acumulado['dias_horas'], dia)
+                    acumulado['intervalos'].append(intervalo)
+                else:
+                    del acumulado['dias_horas'][bisect.bisect_left(acumulado['dias_horas'], dia)]
+                    acumulado['intervalos'].remove(intervalo)
+                acumulado['parada'] = self._union(acumulado['intervalos'])
+
+            # Sin registros que sumar se vuelve a cero exacto (sin arrastre de redondeo)
+            if not acumulado['n_duracion']:
+                acumulado['suma_duracion'] = 0.0
+            if not acumulado['dias']:
+                del self.maquinas[maquina]
+
+    def restar(self, registros):
+        self.sumar(registros, signo=-1)
+
+    @staticmethod
+    def _union(intervalos):
+        """Horas de la unión de los intervalos (inicio, fin) de una máquina."""
+        if not intervalos:
+            return 0.0
+        inicio, fin = np.array(intervalos, dtype=np.int64).T
+        return float(union_intervalos(np.zeros(len(inicio)), inicio, fin).sum())
+
+    def kpis(self):
+        """Mismo resultado que calcular_kpis() sobre el historial completo."""
+        filas = {}
+        suma_intervalos = cantidad_intervalos = 0
+        n_duracion = suma_duracion = parada_total = 0
+        dias_horas = []
+
+        for maquina in sorted(self.maquinas):
+            a = self.maquinas[maquina]
+            fallas = len(a['dias'])
+            horas_totales = np.nan
+            disponibilidad = np.nan
+            if a['dias_horas']:
+                horas_totales = (a['dias_horas'][-1] - a['dias_horas'][0] + 1) * 24.0
+                disponibilidad = np.round((horas_totales - a['parada']) / horas_totales * 100, 2)
+                dias_horas += [a['dias_horas'][0], a['dias_horas'][-1]]
+
+            filas[maquina] = {
+                'Fallas': fallas,
+                'Correctivos': a['correctivos'],
+                'Preventivos': a['preventivos'],
+                'MTBF_dias': np.round((a['dias'][-1] - a['dias'][0]) / (fallas - 1), 1) if fallas > 1 else np.nan,
+                'Intervenciones': a['n_duracion'],
+                'MTTR_horas': np.round(a['suma_duracion'] / a['n_duracion'], 1) if a['n_duracion'] else np.nan,
+                'Fecha_inicio': pd.Timestamp(np.datetime64(a['dias_horas'][0], 'D')) if a['dias_horas'] else pd.NaT,
+                'Fecha_fin': pd.Timestamp(np.datetime64(a['dias_horas'][-1], 'D')) if a['dias_horas'] else pd.NaT,
+                'Horas_totales': horas_totales,
+                'Downtime_total': a['parada'],
+                'Disponibilidad': disponibilidad
+            }
+            suma_intervalos += a['dias'][-1] - a['dias'][0]
+            cantidad_intervalos += fallas - 1
+            n_duracion += a['n_duracion']
+            suma_duracion += a['suma_duracion']
+            parada_total += a['parada']
+
+        por_maquina = pd.DataFrame.from_dict(filas, orient='index', columns=COLUMNAS_KPI)
+        por_maquina.index.name = 'Máquina'
+
+        disponibilidad_global = None
+        if dias_horas:
+            horas_totales = (max(dias_horas) - min(dias_horas) + 1) * 24
+            disponibilidad_global = _numero((horas_totales - parada_total) / horas_totales * 100, 2)
+
+        return {
+            'por_maquina': por_maquina,
+            'total_mantenimientos': int(por_maquina['Fallas'].sum()) if filas else 0,
+            'total_maquinas': len(filas),
+            'mtbf': _numero(suma_intervalos / cantidad_intervalos, 1) if cantidad_intervalos else None,
+            'mttr': _numero(suma_duracion / n_duracion, 1) if n_duracion else None,
+            'disponibilidad': disponibilidad_global
+        }
+
+
+def actualizar_agregados(antes, despues, firma_antes, firma_despues):
+    """Aplica a los acumulados el cambio de una escritura, o los descarta si no se puede probar."""
+    with _cache_lock:
+        agregados = _agregados['datos']
+        if agregados is None or firma_despues is None or _agregados['firma'] != firma_antes:
+            _agregados.update(firma=None, datos=None)
+            return
+        agregados.restar(antes)
+        agregados.sumar(despues)
+        _agregados['firma'] = firma_despues
+        _agregados['pendientes_verificar'] += 1
+
+
+# Tolerancia al comparar KPI: una unidad del último decimal mostrado (un
+# empate de redondeo puede caer distinto según el orden de las sumas)
+_TOLERANCIA_KPI = {
+    'mtbf': 0.1, 'mttr': 0.1, 'disponibilidad': 0.01,
+    'MTBF_dias': 0.1, 'MTTR_horas': 0.1, 'Disponibilidad': 0.01, 'Downtime_total': 1e-6
+}
+
+
+def diferencias_kpis(kpis, referencia):
+    """Indicadores que difieren entre dos resultados de KPI (vacío si coinciden)."""
+    diferencias = []
+    for clave in ['total_mantenimientos', 'total_maquinas', 'mtbf', 'mttr', 'disponibilidad']:
+        a, b = kpis[clave], referencia[clave]
+        if (a is None) != (b is None) or (a is not None and abs(a - b) > _TOLERANCIA_KPI.get(clave, 0) + 1e-9):
+            diferencias.append(f"{clave}: {a} != {b}")
+
+    a, b = kpis['por_maquina'], referencia['por_maquina']
+    if sorted(map(str, a.index)) != sorted(map(str, b.index)):
+        diferencias.append("por_maquina: distintas máquinas")
+        return diferencias
+    b = b.set_axis(b.index.astype(str))
+    for maquina, fila in a.iterrows():
+        for col in COLUMNAS_KPI:
+            x, y = fila[col], b.loc[str(maquina), col]
+            if pd.isna(x) and pd.isna(y):
+                continue
+            if pd.isna(x) != pd.isna(y) or (
+                x != y if col.startswith('Fecha') else abs(float(x) - float(y)) > _TOLERANCIA_KPI.get(col, 0) + 1e-9
+            ):
+                diferencias.append(f"{maquina}.{col}: {x} != {y}")
+    return diferencias
+
+
+def verificar_agregados():
+    """Contrasta los acumulados con calcular_kpis y los reconstruye si difieren: (acumulados, diferencias)."""
+    firma = firma_mantenciones()
+    df = cargar_mantenciones()
+    with _cache_lock:
+        agregados = _agregados['datos'] if _agregados['firma'] == firma else None
+        kpis = agregados.kpis() if agregados else None
+
+    diferencias = diferencias_kpis(kpis, calcular_kpis(df)) if kpis else []
+    if diferencias:
+        app.logger.warning("KPI incrementales descuadrados, se reconstruyen: %s", "; ".join(diferencias[:5]))
+        agregados = AgregadosKPI.desde_df(df)
+    with _cache_lock:
+        if agregados is not None:
+            _agregados.update(firma=firma, datos=agregados)
+        _agregados['pendientes_verificar'] = 0
+    return agregados, diferencias
+
+
+def indicadores_filtrados(df, maquina=None, responsable=None, fecha_desde=None, fecha_hasta=None):
+    """KPIs de un subconjunto ya filtrado; sin filtros se reutilizan los del historial completo."""
+    if not any(_normalizar_filtros(maquina, responsable, fecha_desde, fecha_hasta)):
+        return indicadores_mantenciones()
+    return calcular_kpis(df)
+
+
+def kpis_maquina(kpis, maquina):
+    """Fila de 'por_maquina' de una máquina como dict (valores faltantes en None)."""
+    if maquina not in kpis['por_maquina'].index:
+        return dict.fromkeys(COLUMNAS_KPI)
+    fila = kpis['por_maquina'].loc[maquina]
+    return {col: (None if pd.isna(valor) else valor) for col, valor in fila.items()}
 
 
 # ===================== FLASK APP / MAIL =====================
@@ -127,17 +1923,194 @@ app = Flask(__name__)
 app.secret_key = 'wintec_secret_key'
 load_dotenv()
 
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
+# Configurable por entorno: para pruebas basta un SMTP local
+# (MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=0)
+app.config['MAIL_SERVER'] = os.getenv("MAIL_SERVER", 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.getenv("MAIL_PORT", "587"))
+app.config['MAIL_USE_TLS'] = os.getenv("MAIL_USE_TLS", "1").strip().lower() in ("1", "true", "si", "sí")
+app.config['MAIL_USE_SSL'] = os.getenv("MAIL_USE_SSL", "0").strip().lower() in ("1", "true", "si", "sí")
 app.config['MAIL_USERNAME'] = os.getenv("MAIL_USERNAME")
 app.config['MAIL_PASSWORD'] = os.getenv("MAIL_PASSWORD")
+app.config['MAIL_DEFAULT_SENDER'] = os.getenv("MAIL_DEFAULT_SENDER") or os.getenv("MAIL_USERNAME")
+app.config['MAIL_TIMEOUT'] = int(os.getenv("MAIL_TIMEOUT", "30"))
 
 mail = Mail(app)
 
 USERS_FILE = "usuarios.csv"
 
 
+# ===================== GET CONDICIONAL (ETAG / LAST-MODIFIED) =====================
+
+# Cambia con cada despliegue para que el navegador no reutilice páginas con plantillas viejas
+VERSION_VISTAS = os.getenv("APP_VERSION") or str(int(os.path.getmtime(__file__)))
+
+
+def etag_vista():
+    """ETag de la vista: datos, ruta, filtros, usuario, rol, día y versión de la app (None sin datos)."""
+    firma = obtener_almacen().firma()
+    if firma is None:
+        return None
+    clave = (
+        firma, request.path, sorted(request.args.items(multi=True)),
+        session.get("usuario"), session.get("rol"), datetime.now().date().isoformat(), VERSION_VISTAS
+    )
+    return hashlib.sha1(repr(clave).encode('utf-8')).hexdigest()
+
+
+# Vistas cuya plantilla muestra los mensajes flash (se detecta al ejecutarlas)
+_vistas_con_avisos = set()
+
+
+def muestra_avisos_pendientes():
+    """True si hay mensajes flash pendientes y esta vista los muestra: debe ejecutarse."""
+    return bool(session.get("_flashes")) and request.endpoint in _vistas_con_avisos
+
+
+def vista_mostro_avisos():
+    """True si la vista recién ejecutada mostró mensajes flash; la registra como vista con avisos."""
+    if request_ctx.flashes is None:
+        return False
+    _vistas_con_avisos.add(request.endpoint)
+    return bool(request_ctx.flashes)
+
+
+def respuesta_condicional(vista):
+    """GET condicional por ETag: 304 sin ejecutar la vista si el navegador ya tiene esa versión."""
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        # Sin sesión (redirige al login) o con mensajes flash que la vista muestra, siempre se ejecuta
+        if not session.get("logged_in") or muestra_avisos_pendientes():
+            return vista(*args, **kwargs)
+
+        etag = etag_vista()
+        if etag is None:
+            return vista(*args, **kwargs)
+        modificado = obtener_almacen().modificado()
+        ultima = datetime.fromtimestamp(int(modificado), tz=timezone.utc) if modificado else None
+
+        # Solo el ETag decide: If-Modified-Since no ve usuario, filtros ni día
+        if request.if_none_match.contains(etag):
+            resp = make_response("", 304)
+        else:
+            resp = make_response(vista(*args, **kwargs))
+            if resp.status_code != 200 or vista_mostro_avisos():
+                return resp
+
+        resp.set_etag(etag)
+        if ultima:
+            resp.last_modified = ultima
+        # El navegador guarda la respuesta pero debe revalidarla en cada uso
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
+
+    return envoltura
+
+
+# ===================== CACHÉ DE VISTAS =====================
+
+class CacheLRU:
+    """Caché LRU segura entre hilos, acotada por entradas, bytes y antigüedad (TTL)."""
+
+    def __init__(self, max_entradas=256, max_bytes=64 * 1024 * 1024, ttl=300):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = self.fallos = self.expiradas = self.descartadas = 0
+
+    def obtener(self, clave):
+        """Valor guardado, o None si no está o venció."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            valor, tamano, creado = entrada
+            if time.monotonic() - creado > self.ttl:
+                self._quitar(clave)
+                self.expiradas += 1
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, valor, tamano):
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            if tamano > self.max_bytes:
+                return
+            self._datos[clave] = (valor, tamano, time.monotonic())
+            self._bytes += tamano
+            while len(self._datos) > self.max_entradas or self._bytes > self.max_bytes:
+                self._quitar(next(iter(self._datos)))
+                self.descartadas += 1
+
+    def _quitar(self, clave):
+        self._bytes -= self._datos.pop(clave)[1]
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._datos),
+                'bytes': self._bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'expiradas': self.expiradas,
+                'descartadas': self.descartadas,
+                'tasa_aciertos': round(self.aciertos / consultas, 3) if consultas else None
+            }
+
+
+cache_vistas = CacheLRU(
+    max_entradas=int(os.getenv("MANTENCIONES_CACHE_VISTAS", "256")),
+    max_bytes=int(os.getenv("MANTENCIONES_CACHE_VISTAS_MB", "64")) * 1024 * 1024,
+    ttl=int(os.getenv("MANTENCIONES_CACHE_VISTAS_TTL", "300"))
+)
+
+
+def vista_cacheada(por_usuario=False):
+    """Guarda la respuesta de una vista de solo lectura en cache_vistas, por ruta, filtros, rol, datos y día."""
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            firma = obtener_almacen().firma()
+            if not session.get("logged_in") or muestra_avisos_pendientes() or firma is None:
+                return vista(*args, **kwargs)
+
+            clave = (
+                request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))),
+                session.get("rol"), session.get("usuario") if por_usuario else None,
+                firma, datetime.now().date()
+            )
+            guardada = cache_vistas.obtener(clave)
+            if guardada is not None:
+                cuerpo, mimetype = guardada
+                resp = make_response(cuerpo, 200)
+                resp.mimetype = mimetype
+                resp.headers["X-Cache"] = "HIT"
+                return resp
+
+            resp = make_response(vista(*args, **kwargs))
+            if resp.status_code == 200 and not resp.is_streamed and not vista_mostro_avisos():
+                cuerpo = resp.get_data()
+                cache_vistas.guardar(clave, (cuerpo, resp.mimetype), len(cuerpo))
+                resp.headers["X-Cache"] = "MISS"
+            return resp
+
+        return envoltura
+    return decorador
+
+
 # ===================== USUARIOS =====================
 
 def cargar_usuarios():
@@ -167,6 +2140,8 @@ def guardar_usuarios(lista_usuarios):
 # ===================== RUTAS PRINCIPALES =====================
 
 @app.route('/')
+@respuesta_condicional
+@vista_cacheada(por_usuario=True)
 def home():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
@@ -185,42 +2160,6 @@ def home():
     # Cargar CSV normalizado
     df = cargar_mantenciones()
 
-    # Aseguramos que existan las columnas opcionales
-    for col in ['Hora_inicio', 'Hora_fin', 'Duración_horas', 'Tipo', 'Frecuencia_dias', 'Próximo_mantenimiento']:
-        if col not in df.columns:
-            df[col] = None
-
-    # ================= SEMÁFORO PREVENTIVO POR FILA =================
-    hoy = datetime.now().date()
-
-    def dias_restantes_row(row):
-        if row.get('Tipo') != 'Preventivo' or pd.isna(row.get('Próximo_mantenimiento')) or row.get('Próximo_mantenimiento') in [None, ""]:
-            return None
-        try:
-            fecha = datetime.strptime(str(row['Próximo_mantenimiento']), "%Y-%m-%d").date()
-            return (fecha - hoy).days
-        except Exception:
-            return None
-
-    if not df.empty:
-        df['Dias_restantes_prev'] = df.apply(dias_restantes_row, axis=1)
-
-        def estado_prev_row(row):
-            dr = row['Dias_restantes_prev']
-            if dr is None:
-                return ""
-            if dr < 0:
-                return "Vencido"
-            if dr == 0:
-                return "Hoy"
-            if dr <= 7:
-                return "Próximo"
-            return "OK"
-
-        df['Estado_prev'] = df.apply(estado_prev_row, axis=1)
-    else:
-        df['Estado_prev'] = []
-
     # ================= LISTAS PARA LOS SELECT =================
     if not df.empty:
         maquinas_unicas = sorted(df['Máquina'].dropna().unique()) if 'Máquina' in df.columns else []
@@ -230,30 +2169,22 @@ def home():
         responsables_unicos = []
 
     # ================== APLICAR FILTROS A LA TABLA ==================
-    df_filtrado = aplicar_filtros(df, maquina_filtro, responsable_filtro, fecha_desde, fecha_hasta)
-
-    if not df_filtrado.empty:
-        df_filtrado['Fecha'] = pd.to_datetime(df_filtrado['Fecha'], errors='coerce')
-        df_tabla = df_filtrado[['Máquina', 'Fecha', 'Descripción', 'Responsable', 'Duración_horas', 'Estado_prev']].copy()
-        df_tabla['Fecha'] = df_tabla['Fecha'].dt.strftime('%d-%m-%Y')
-    else:
-        df_tabla = pd.DataFrame(columns=['Máquina', 'Fecha', 'Descripción', 'Responsable', 'Duración_horas', 'Estado_prev'])
+    df_filtrado = consultar_mantenciones(maquina_filtro, responsable_filtro, fecha_desde, fecha_hasta)
+
+    # ================= PÁGINA VISIBLE (con su semáforo preventivo) =================
+    tabla = pagina_mantenciones(
+        df_filtrado,
+        request.args.get("page"),
+        request.args.get("page_size"),
+        request.args.get("sort", "")
+    )
 
     # --------- RESUMEN PREVENTIVOS PARA EL AVISO (banner arriba) ---------
-    total_prev = 0
-    vencidos_prev = 0
-    proximos_prev = 0
-
-    try:
-        prev = df[df['Tipo'] == 'Preventivo'].copy()
-        prev_valid = prev[prev['Dias_restantes_prev'].notna()]
-
-        if not prev_valid.empty:
-            total_prev = len(prev_valid)
-            vencidos_prev = int((prev_valid['Dias_restantes_prev'] < 0).sum())
-            proximos_prev = int(prev_valid['Dias_restantes_prev'].between(0, 7).sum())
-    except Exception:
-        pass
+    vencimientos = indice_vencimientos()
+    hoy = _dia(datetime.now().date())
+    total_prev = len(vencimientos)
+    vencidos_prev = vencimientos.contar(hasta=hoy - 1)
+    proximos_prev = vencimientos.contar(hoy, hoy + DIAS_AVISO_PREVENTIVO)
     # ---------------------------------------------------------------------
 
     return render_template(
@@ -262,7 +2193,12 @@ def home():
         usuario=usuario,
         rol=rol,
         puede_editar=puede_editar,
-        mantenimientos=df_tabla.to_dict(orient='records'),
+        mantenimientos=tabla['registros'],
+        total_registros=tabla['total'],
+        pagina=tabla['pagina'],
+        paginas=tabla['paginas'],
+        por_pagina=tabla['por_pagina'],
+        orden=tabla['orden'],
         total_prev=total_prev,
         vencidos_prev=vencidos_prev,
         proximos_prev=proximos_prev,
@@ -275,6 +2211,28 @@ def home():
     )
 
 
+@app.route('/api/mantenciones')
+@respuesta_condicional
+@vista_cacheada()
+def api_mantenciones():
+    """Páginas siguientes de la tabla de inicio (mismos filtros y parámetros page/page_size/sort)."""
+    if not session.get("logged_in"):
+        return jsonify({"error": "No autenticado"}), 401
+
+    df_filtrado = consultar_mantenciones(
+        request.args.get("maquina", "Todas"),
+        request.args.get("responsable", "Todos"),
+        request.args.get("fecha_desde", ""),
+        request.args.get("fecha_hasta", "")
+    )
+    return jsonify(pagina_mantenciones(
+        df_filtrado,
+        request.args.get("page"),
+        request.args.get("page_size"),
+        request.args.get("sort", "")
+    ))
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -329,6 +2287,9 @@ def agregar_mantenimiento():
     tipo = request.form.get('tipo', 'Correctivo')
     freq_str = request.form.get('frecuencia_dias', '').strip()
     frecuencia = int(freq_str) if freq_str.isdigit() and int(freq_str) > 0 else None
+    if frecuencia is not None and frecuencia > FRECUENCIA_MAX_DIAS:
+        flash(f"La frecuencia debe estar entre 1 y {FRECUENCIA_MAX_DIAS} días.", "danger")
+        return redirect(url_for('home'))
 
     proximo = None
     if tipo == 'Preventivo' and frecuencia:
@@ -352,20 +2313,14 @@ def agregar_mantenimiento():
         'Próximo_mantenimiento': proximo
     }
 
-    df = cargar_mantenciones()
-    for col in ['Hora_inicio', 'Hora_fin', 'Duración_horas', 'Tipo', 'Frecuencia_dias', 'Próximo_mantenimiento']:
-        if col not in df.columns:
-            df[col] = None
-
-    df = pd.concat([df, pd.DataFrame([nuevo])], ignore_index=True)
-    df.to_csv("mantenciones.csv", index=False)
+    insertar_mantencion(nuevo)
 
     flash("Mantenimiento agregado exitosamente", "success")
     return redirect(url_for('home'))
 
 
-@app.route('/eliminar/<int:indice>', methods=['POST'])
-def eliminar_mantenimiento(indice):
+@app.route('/eliminar/<int:id_registro>', methods=['POST'])
+def eliminar_mantenimiento(id_registro):
     if not session.get("logged_in"):
         return redirect(url_for("login"))
 
@@ -374,20 +2329,16 @@ def eliminar_mantenimiento(indice):
         flash("No tienes permisos para eliminar mantenimientos.", "warning")
         return redirect(url_for('home'))
 
-    df = cargar_mantenciones()
-
-    if indice < 0 or indice >= len(df):
+    if not eliminar_mantencion(id_registro):
         flash("Registro no encontrado", "danger")
         return redirect(url_for('home'))
 
-    df = df.drop(index=indice).reset_index(drop=True)
-    df.to_csv("mantenciones.csv", index=False)
     flash("Mantenimiento eliminado correctamente", "success")
     return redirect(url_for('home'))
 
 
-@app.route('/editar/<int:indice>', methods=['POST'])
-def editar_mantenimiento(indice):
+@app.route('/editar/<int:id_registro>', methods=['POST'])
+def editar_mantenimiento(id_registro):
     if not session.get("logged_in"):
         return redirect(url_for("login"))
 
@@ -396,37 +2347,33 @@ def editar_mantenimiento(indice):
         flash("No tienes permisos para editar mantenimientos.", "warning")
         return redirect(url_for('home'))
 
-    df = cargar_mantenciones()
-
-    if indice < 0 or indice >= len(df):
-        flash("Registro no encontrado", "danger")
-        return redirect(url_for('home'))
-
-    for col in ['Hora_inicio', 'Hora_fin', 'Duración_horas', 'Tipo', 'Frecuencia_dias']:
-        if col not in df.columns:
-            df[col] = None
-
-    df.loc[indice, 'Máquina'] = normalizar_texto(request.form['maquina'])
-    df.loc[indice, 'Fecha'] = request.form['fecha']
-    df.loc[indice, 'Descripción'] = request.form['descripcion']
-    df.loc[indice, 'Responsable'] = normalizar_texto(request.form['responsable'])
-
     hora_inicio = request.form.get('hora_inicio', '').strip()
     hora_fin = request.form.get('hora_fin', '').strip()
     duracion = request.form.get('duracion', '').strip()
 
-    df.loc[indice, 'Hora_inicio'] = hora_inicio if hora_inicio != '' else None
-    df.loc[indice, 'Hora_fin'] = hora_fin if hora_fin != '' else None
-    df.loc[indice, 'Duración_horas'] = duracion if duracion != '' else None
-
     tipo = request.form.get('tipo', 'Correctivo')
     freq_str = request.form.get('frecuencia_dias', '').strip()
     frecuencia = int(freq_str) if freq_str.isdigit() and int(freq_str) > 0 else None
+    if frecuencia is not None and frecuencia > FRECUENCIA_MAX_DIAS:
+        flash(f"La frecuencia debe estar entre 1 y {FRECUENCIA_MAX_DIAS} días.", "danger")
+        return redirect(url_for('home'))
 
-    df.loc[indice, 'Tipo'] = tipo
-    df.loc[indice, 'Frecuencia_dias'] = frecuencia
+    cambios = {
+        'Máquina': normalizar_texto(request.form['maquina']),
+        'Fecha': request.form['fecha'],
+        'Descripción': request.form['descripcion'],
+        'Responsable': normalizar_texto(request.form['responsable']),
+        'Hora_inicio': hora_inicio if hora_inicio != '' else None,
+        'Hora_fin': hora_fin if hora_fin != '' else None,
+        'Duración_horas': duracion if duracion != '' else None,
+        'Tipo': tipo,
+        'Frecuencia_dias': frecuencia
+    }
+
+    if not actualizar_mantencion(id_registro, cambios):
+        flash("Registro no encontrado", "danger")
+        return redirect(url_for('home'))
 
-    df.to_csv("mantenciones.csv", index=False)
     flash("Mantenimiento actualizado correctamente", "success")
     return redirect(url_for('home'))
 
@@ -434,6 +2381,8 @@ def editar_mantenimiento(indice):
 # ===================== DASHBOARD =====================
 
 @app.route('/dashboard')
+@respuesta_condicional
+@vista_cacheada(por_usuario=True)
 def dashboard():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
@@ -459,7 +2408,6 @@ def dashboard():
             values_mes=[]
         )
 
-    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
     df = df.dropna(subset=['Fecha'])
 
     if df.empty:
@@ -479,60 +2427,17 @@ def dashboard():
         )
 
     total_mantenimientos = len(df)
-    total_maquinas = df['Máquina'].nunique() if 'Máquina' in df.columns else 0
 
     hoy = pd.Timestamp.today()
     periodo_actual = hoy.to_period('M')
     df['Periodo'] = df['Fecha'].dt.to_period('M')
     fallas_mes_actual = df[df['Periodo'] == periodo_actual].shape[0]
 
-    mtbf_global = None
-    if 'Máquina' in df.columns:
-        df_mtbf = df.sort_values(by=['Máquina', 'Fecha'])
-        df_mtbf['DifDias'] = df_mtbf.groupby('Máquina')['Fecha'].diff().dt.days
-        if df_mtbf['DifDias'].notna().any():
-            mtbf_global = round(df_mtbf['DifDias'].dropna().mean(), 1)
-
-    mttr_global = None
-    if 'Duración_horas' in df.columns:
-        df['Duración_horas'] = pd.to_numeric(df['Duración_horas'], errors='coerce')
-        if df['Duración_horas'].notna().any():
-            mttr_global = round(df['Duración_horas'].dropna().mean(), 1)
-
-    disponibilidad_global = None
-    if all(col in df.columns for col in ['Hora_inicio', 'Hora_fin']):
-        df_horas = df.copy()
-        df_horas['Hora_inicio'] = df_horas['Hora_inicio'].fillna('')
-        df_horas['Hora_fin'] = df_horas['Hora_fin'].fillna('')
-
-        df_horas['Inicio_dt'] = pd.to_datetime(
-            df_horas['Fecha'].dt.strftime('%Y-%m-%d') + ' ' + df_horas['Hora_inicio'],
-            errors='coerce'
-        )
-        df_horas['Fin_dt'] = pd.to_datetime(
-            df_horas['Fecha'].dt.strftime('%Y-%m-%d') + ' ' + df_horas['Hora_fin'],
-            errors='coerce'
-        )
-
-        mask = df_horas['Inicio_dt'].notna() & df_horas['Fin_dt'].notna()
-        df_valid = df_horas[mask].copy()
-
-        if not df_valid.empty:
-            df_valid['Downtime_horas'] = (
-                df_valid['Fin_dt'] - df_valid['Inicio_dt']
-            ).dt.total_seconds() / 3600.0
-            df_valid['Downtime_horas'] = df_valid['Downtime_horas'].clip(lower=0)
-
-            fecha_min = df_valid['Fecha'].min()
-            fecha_max = df_valid['Fecha'].max()
-            dias_periodo = (fecha_max - fecha_min).days + 1
-            horas_totales = dias_periodo * 24
-
-            downtime_total = df_valid['Downtime_horas'].sum()
-            if horas_totales > 0:
-                disponibilidad_global = round(
-                    (horas_totales - downtime_total) / horas_totales * 100, 2
-                )
+    kpis = indicadores_mantenciones()
+    total_maquinas = kpis['total_maquinas']
+    mtbf_global = kpis['mtbf']
+    mttr_global = kpis['mttr']
+    disponibilidad_global = kpis['disponibilidad']
 
     fallas_por_mes = (
         df
@@ -561,64 +2466,61 @@ def dashboard():
 
 # ===================== EXPORTAR DATOS =====================
 
-@app.route('/exportar_datos')
-def exportar_datos():
-    if not session.get("logged_in"):
-        return redirect(url_for("login"))
+# Filas que se serializan por bloque al exportar (acota la memoria extra del export)
+FILAS_POR_BLOQUE_CSV = int(os.getenv("MANTENCIONES_BLOQUE_CSV", "5000"))
 
-    df = cargar_mantenciones()
 
-    if df.empty or 'Fecha' not in df.columns:
-        flash("No hay datos para exportar.", "warning")
-        return redirect(url_for('dashboard'))
+def csv_en_bloques(df, orden=None, filas=None):
+    """CSV de exportación (';', UTF-8 con BOM) en bloques de bytes, en el orden de posiciones dado."""
+    filas = filas or FILAS_POR_BLOQUE_CSV
+    orden = np.arange(len(df)) if orden is None else orden
+    yield '\ufeff'.encode('utf-8')
+    for inicio in range(0, max(len(orden), 1), filas):
+        bloque = serializar_mantenciones(df.iloc[orden[inicio:inicio + filas]])
+        yield bloque.to_csv(index=False, sep=';', header=inicio == 0).encode('utf-8')
 
-    maquina = request.args.get('maquina', '').strip()
-    responsable = request.args.get('responsable', '').strip()
-    fecha_desde = request.args.get('fecha_desde', '').strip()
-    fecha_hasta = request.args.get('fecha_hasta', '').strip()
 
-    if maquina:
-        maquina = normalizar_texto(maquina)
-    if responsable:
-        responsable = normalizar_texto(responsable)
-
-    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
-    df = df.dropna(subset=['Fecha'])
+def comprimir_gzip(bloques, nivel=6):
+    """Comprime al vuelo un generador de bytes en formato gzip."""
+    compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+    for bloque in bloques:
+        comprimido = compresor.compress(bloque)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
 
-    if maquina and 'Máquina' in df.columns:
-        df = df[df['Máquina'] == maquina]
 
-    if responsable and 'Responsable' in df.columns:
-        df = df[df['Responsable'] == responsable]
+@app.route('/exportar_datos')
+def exportar_datos():
+    if not session.get("logged_in"):
+        return redirect(url_for("login"))
 
-    if fecha_desde:
-        try:
-            f_desde = pd.to_datetime(fecha_desde)
-            df = df[df['Fecha'] >= f_desde]
-        except Exception:
-            pass
+    if firma_mantenciones() is None:
+        flash("No hay datos para exportar.", "warning")
+        return redirect(url_for('dashboard'))
 
-    if fecha_hasta:
-        try:
-            f_hasta = pd.to_datetime(fecha_hasta)
-            df = df[df['Fecha'] <= f_hasta]
-        except Exception:
-            pass
+    maquina = request.args.get('maquina', '').strip()
+    responsable = request.args.get('responsable', '').strip()
+    fecha_desde = request.args.get('fecha_desde', '').strip()
+    fecha_hasta = request.args.get('fecha_hasta', '').strip()
 
-    if df.empty:
+    df = consultar_mantenciones(maquina, responsable, fecha_desde, fecha_hasta)
+
+    if df.empty or 'Fecha' not in df.columns:
         flash("No hay datos que coincidan con los filtros para exportar.", "warning")
         return redirect(url_for('dashboard'))
 
-    df = df.sort_values(by='Fecha')
-
-    from io import StringIO
-    output = StringIO()
-    df.to_csv(output, index=False, sep=';', encoding='utf-8-sig')
-    csv_data = output.getvalue()
+    bloques = csv_en_bloques(df, np.argsort(df['Fecha'].to_numpy(), kind='stable'))
+    comprimir = 'gzip' in request.accept_encodings
+    if comprimir:
+        bloques = comprimir_gzip(bloques)
 
-    resp = make_response(csv_data)
+    resp = Response(bloques, mimetype="text/csv")
     resp.headers["Content-Disposition"] = "attachment; filename=mantenimientos_filtrados.csv"
     resp.headers["Content-Type"] = "text/csv; charset=utf-8"
+    resp.headers["Vary"] = "Accept-Encoding"
+    if comprimir:
+        resp.headers["Content-Encoding"] = "gzip"
 
     return resp
 
@@ -626,6 +2528,8 @@ def exportar_datos():
 # ===================== ANÁLISIS / PARETO =====================
 
 @app.route('/analisis')
+@respuesta_condicional
+@vista_cacheada()
 def analisis():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
@@ -671,6 +2575,8 @@ def analisis():
 # ===================== REPETITIVIDAD =====================
 
 @app.route('/repetitividad')
+@respuesta_condicional
+@vista_cacheada()
 def repetitividad():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
@@ -705,9 +2611,7 @@ def repetitividad():
             fecha_hasta=""
         )
 
-    df = df.dropna(subset=['Descripción'])
-    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
-    df = df.dropna(subset=['Fecha'])
+    df = df.dropna(subset=['Descripción', 'Fecha'])
 
     maquina_sel = (request.args.get('maquina') or "").strip()
     if maquina_sel:
@@ -716,24 +2620,9 @@ def repetitividad():
     fecha_desde = (request.args.get('fecha_desde') or "").strip()
     fecha_hasta = (request.args.get('fecha_hasta') or "").strip()
 
-    df_filtrado = df.copy()
-
-    if maquina_sel and 'Máquina' in df_filtrado.columns:
-        df_filtrado = df_filtrado[df_filtrado['Máquina'] == maquina_sel]
-
-    if fecha_desde:
-        try:
-            f_desde = pd.to_datetime(fecha_desde)
-            df_filtrado = df_filtrado[df_filtrado['Fecha'] >= f_desde]
-        except Exception:
-            pass
-
-    if fecha_hasta:
-        try:
-            f_hasta = pd.to_datetime(fecha_hasta)
-            df_filtrado = df_filtrado[df_filtrado['Fecha'] <= f_hasta]
-        except Exception:
-            pass
+    df_filtrado = consultar_mantenciones(maquina_sel, None, fecha_desde, fecha_hasta)
+    if 'Descripción' in df_filtrado.columns:
+        df_filtrado = df_filtrado.dropna(subset=['Descripción'])
 
     if df_filtrado.empty:
         flash("No hay registros que coincidan con esos filtros.", "warning")
@@ -782,25 +2671,14 @@ def repetitividad():
 # ===================== MTBF =====================
 
 @app.route('/mtbf')
+@respuesta_condicional
+@vista_cacheada()
 def mtbf():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
 
-    df = cargar_mantenciones()
-
-    df = df.dropna(subset=['Máquina', 'Fecha'])
-    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
-    df = df.dropna(subset=['Fecha'])
-    df = df.sort_values(by=['Máquina', 'Fecha'])
-
-    df['DifDias'] = df.groupby('Máquina')['Fecha'].diff().dt.days
+    mtbf_df = indicadores_mantenciones()['por_maquina'][['Fallas', 'MTBF_dias']].reset_index()
 
-    mtbf_df = df.groupby('Máquina').agg(
-        Fallas=('Fecha', 'count'),
-        MTBF_dias=('DifDias', 'mean')
-    ).reset_index()
-
-    mtbf_df['MTBF_dias'] = mtbf_df['MTBF_dias'].round(1)
     mtbf_df['MTBF_dias'] = mtbf_df['MTBF_dias'].where(mtbf_df['MTBF_dias'].notna(), None)
     mtbf_df = mtbf_df.sort_values(by='MTBF_dias', na_position='last')
 
@@ -821,6 +2699,8 @@ def mtbf():
 # ===================== MTTR =====================
 
 @app.route('/mttr')
+@respuesta_condicional
+@vista_cacheada()
 def mttr():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
@@ -831,19 +2711,13 @@ def mttr():
         flash("Aún no hay datos de duración para calcular MTTR.", "warning")
         return redirect(url_for('analisis'))
 
-    df['Duración_horas'] = pd.to_numeric(df['Duración_horas'], errors='coerce')
-    df_valid = df.dropna(subset=['Máquina', 'Duración_horas'])
+    por_maquina = indicadores_mantenciones()['por_maquina']
+    mttr_df = por_maquina.loc[por_maquina['Intervenciones'] > 0, ['Intervenciones', 'MTTR_horas']].reset_index()
 
-    if df_valid.empty:
+    if mttr_df.empty:
         flash("No hay registros con duración para calcular MTTR.", "warning")
         return redirect(url_for('analisis'))
 
-    mttr_df = df_valid.groupby('Máquina').agg(
-        Intervenciones=('Duración_horas', 'count'),
-        MTTR_horas=('Duración_horas', 'mean')
-    ).reset_index()
-
-    mttr_df['MTTR_horas'] = mttr_df['MTTR_horas'].round(1)
     mttr_df = mttr_df.sort_values(by='MTTR_horas', ascending=False)
 
     labels = mttr_df['Máquina'].tolist()
@@ -863,6 +2737,8 @@ def mttr():
 # ===================== DISPONIBILIDAD =====================
 
 @app.route('/disponibilidad')
+@respuesta_condicional
+@vista_cacheada()
 def disponibilidad():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
@@ -879,56 +2755,20 @@ def disponibilidad():
         flash("No hay datos suficientes para calcular disponibilidad.", "warning")
         return redirect(url_for('analisis'))
 
-    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
-    df = df.dropna(subset=['Fecha'])
-    if df.empty:
-        flash("No hay fechas válidas para calcular disponibilidad.", "warning")
-        return redirect(url_for('analisis'))
-
-    df['Hora_inicio'] = df['Hora_inicio'].fillna('')
-    df['Hora_fin'] = df['Hora_fin'].fillna('')
-
-    df['Inicio_dt'] = pd.to_datetime(
-        df['Fecha'].dt.strftime('%Y-%m-%d') + ' ' + df['Hora_inicio'],
-        errors='coerce'
-    )
-    df['Fin_dt'] = pd.to_datetime(
-        df['Fecha'].dt.strftime('%Y-%m-%d') + ' ' + df['Hora_fin'],
-        errors='coerce'
-    )
+    por_maquina = indicadores_mantenciones()['por_maquina']
+    res_df = por_maquina.loc[
+        por_maquina['Disponibilidad'].notna(),
+        ['Fecha_inicio', 'Fecha_fin', 'Horas_totales', 'Downtime_total', 'Disponibilidad']
+    ].reset_index()
 
-    mask = df['Inicio_dt'].notna() & df['Fin_dt'].notna()
-    df_valid = df[mask].copy()
-
-    if df_valid.empty:
+    if res_df.empty:
         flash("No hay registros con hora de inicio y fin para calcular disponibilidad.", "warning")
         return redirect(url_for('analisis'))
 
-    df_valid['Downtime_horas'] = (df_valid['Fin_dt'] - df_valid['Inicio_dt']).dt.total_seconds() / 3600.0
-    df_valid['Downtime_horas'] = df_valid['Downtime_horas'].clip(lower=0)
-
-    resultados = []
-    for maquina, grupo in df_valid.groupby('Máquina'):
-        fecha_min = grupo['Fecha'].min()
-        fecha_max = grupo['Fecha'].max()
-        dias_periodo = (fecha_max - fecha_min).days + 1
-        horas_totales = dias_periodo * 24
-
-        downtime_total = grupo['Downtime_horas'].sum()
-        disponibilidad_val = None
-        if horas_totales > 0:
-            disponibilidad_val = (horas_totales - downtime_total) / horas_totales * 100
-
-        resultados.append({
-            'Máquina': maquina,
-            'Fecha_inicio': fecha_min.date().isoformat(),
-            'Fecha_fin': fecha_max.date().isoformat(),
-            'Horas_totales': round(horas_totales, 1),
-            'Downtime_total': round(downtime_total, 1),
-            'Disponibilidad': round(disponibilidad_val, 2) if disponibilidad_val is not None else None
-        })
-
-    res_df = pd.DataFrame(resultados)
+    res_df['Fecha_inicio'] = res_df['Fecha_inicio'].dt.strftime('%Y-%m-%d')
+    res_df['Fecha_fin'] = res_df['Fecha_fin'].dt.strftime('%Y-%m-%d')
+    res_df['Horas_totales'] = res_df['Horas_totales'].astype(int)
+    res_df['Downtime_total'] = res_df['Downtime_total'].round(1)
     res_df = res_df.sort_values(by='Disponibilidad', ascending=True)
 
     labels = res_df['Máquina'].tolist()
@@ -947,21 +2787,148 @@ def disponibilidad():
 
 # ===================== INFORME PDF =====================
 
+AZUL_GRAFICOS = colors.HexColor("#1F77B4")
+
+
+def grafico_barras(etiquetas, valores, titulo, ancho, alto, horizontal=False,
+                   eje_valores="Cantidad", eje_categorias=None):
+    """Gráfico de barras vectorial de reportlab (Drawing) para dibujar con renderPDF.draw."""
+    dibujo = Drawing(ancho, alto)
+    grafico = HorizontalBarChart() if horizontal else VerticalBarChart()
+
+    # Márgenes para título, etiquetas de ejes y nombres de categorías
+    margen_categorias = (min(max((len(str(e)) for e in etiquetas), default=0), 22) * 4 + 8) if horizontal else 12
+    grafico.x = (margen_categorias if horizontal else 14) + 14
+    grafico.y = 26 if horizontal else 30
+    grafico.width = ancho - grafico.x - 10
+    grafico.height = alto - grafico.y - 22
+
+    grafico.data = [list(valores)]
+    grafico.categoryAxis.categoryNames = [str(e)[:22] for e in etiquetas]
+    grafico.categoryAxis.labels.fontSize = 7
+    grafico.categoryAxis.labels.fontName = "Helvetica"
+    grafico.valueAxis.valueMin = 0
+    grafico.valueAxis.labels.fontSize = 7
+    grafico.valueAxis.visibleGrid = True
+    grafico.valueAxis.gridStrokeColor = colors.lightgrey
+    grafico.valueAxis.gridStrokeDashArray = (2, 2)
+    grafico.valueAxis.gridStrokeWidth = 0.5
+    if max(valores, default=0) <= 5:
+        grafico.valueAxis.valueMax = 5
+        grafico.valueAxis.valueStep = 1
+    grafico.bars[0].fillColor = AZUL_GRAFICOS
+    grafico.bars[0].strokeColor = None
+    grafico.barSpacing = 2
+    if horizontal:
+        grafico.categoryAxis.labels.boxAnchor = 'e'
+        grafico.categoryAxis.labels.dx = -3
+    else:
+        grafico.categoryAxis.labels.boxAnchor = 'n'
+        grafico.categoryAxis.labels.dy = -3
+    dibujo.add(grafico)
+
+    dibujo.add(String(ancho / 2.0, alto - 12, titulo, fontName="Helvetica-Bold", fontSize=10, textAnchor='middle'))
+    etiqueta_x = eje_valores if horizontal else eje_categorias
+    etiqueta_y = eje_categorias if horizontal else eje_valores
+    if etiqueta_x:
+        dibujo.add(String(grafico.x + grafico.width / 2.0, 4, etiqueta_x, fontName="Helvetica", fontSize=8,
+                          textAnchor='middle'))
+    if etiqueta_y:
+        vertical = Group(String(0, 0, etiqueta_y, fontName="Helvetica", fontSize=8, textAnchor='middle'))
+        vertical.translate(10, grafico.y + grafico.height / 2.0)
+        vertical.rotate(90)
+        dibujo.add(vertical)
+    return dibujo
+
+
+# Detalle del informe: filas por página y un único estilo para todas las páginas
+FILAS_DETALLE_PDF = 25
+ENCABEZADO_DETALLE_PDF = ["Fecha", "Máquina", "Tipo", "Responsable", "Duración (h)"]
+ANCHOS_DETALLE_PDF = [25 * mm, 35 * mm, 35 * mm, 40 * mm, 25 * mm]
+ESTILO_DETALLE_PDF = TableStyle([
+    ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 8),
+    ('FONT', (0, 1), (-1, -1), 'Helvetica', 8),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+    ('ALIGN', (0, 1), (0, -1), 'CENTER'),
+    ('ALIGN', (-1, 1), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#F0F0F0")),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [None, colors.whitesmoke]),
+])
+
+LOGO_INFORME = os.path.join(app.root_path, 'static', 'logo_wintec.png')
+_logo_informe = {'firma': None, 'imagen': None}
+_logo_informe_lock = threading.Lock()
+
+
+def logo_informe():
+    """ImageReader del logo, cargado una vez por proceso (None si no existe)."""
+    try:
+        st = os.stat(LOGO_INFORME)
+    except FileNotFoundError:
+        return None
+    firma = (st.st_mtime_ns, st.st_size)
+    with _logo_informe_lock:
+        if _logo_informe['firma'] != firma:
+            imagen = ImageReader(LOGO_INFORME)
+            imagen.getRGBData()
+            _logo_informe['imagen'] = imagen
+            _logo_informe['firma'] = firma
+        return _logo_informe['imagen']
+
+
+def paginas_detalle_pdf(df, filas=FILAS_DETALLE_PDF):
+    """Filas del detalle del informe, de a una página y ordenadas por fecha."""
+    if df.empty or 'Fecha' not in df.columns:
+        return
+    orden = np.argsort(df['Fecha'].to_numpy(), kind='stable')
+    for inicio in range(0, len(orden), filas):
+        bloque = df.iloc[orden[inicio:inicio + filas]]
+        vacia = [''] * len(bloque)
+        fechas = bloque['Fecha'].dt.strftime('%d-%m-%Y').fillna('-')
+        columnas = [
+            bloque[col].astype(object) if col in bloque.columns else vacia
+            for col in ['Máquina', 'Tipo', 'Responsable']
+        ]
+        if 'Duración_horas' in bloque.columns:
+            horas = horas_float(bloque['Duración_horas'])
+            duracion = horas.astype(str).where(horas.notna(), '-')
+        else:
+            duracion = vacia
+        yield [list(fila) for fila in zip(fechas, *columnas, duracion)]
+
+
 @app.route('/informe_pdf')
 def informe_pdf():
+    """Informe PDF con los filtros de la URL; con ?modo=async se encola en segundo plano."""
     if not session.get("logged_in"):
         return redirect(url_for("login"))
 
     usuario = session.get("usuario", "admin")
     rol = session.get("rol", "admin")
+    filtros = filtros_informe(request.args)
 
-    maquina_filtro = request.args.get("maquina", "Todas")
-    responsable_filtro = request.args.get("responsable", "Todos")
-    fecha_desde = request.args.get("fecha_desde", "")
-    fecha_hasta = request.args.get("fecha_hasta", "")
+    if request.args.get("modo") == "async":
+        trabajo = encolar_informe(usuario, rol, filtros)
+        if trabajo is None:
+            return jsonify({"error": "Demasiados informes en cola, intenta en unos minutos."}), 503
+        return jsonify(estado_trabajo(trabajo)), 200 if trabajo['estado'] == 'listo' else 202
 
-    df = cargar_mantenciones()
-    df = aplicar_filtros(df, maquina_filtro, responsable_filtro, fecha_desde, fecha_hasta)
+    ruta = obtener_informe(usuario, rol, filtros)
+    return send_file(
+        ruta,
+        as_attachment=True,
+        download_name="informe_mantenimiento.pdf",
+        mimetype="application/pdf"
+    )
+
+
+def generar_informe_pdf(usuario, rol, maquina_filtro="Todas", responsable_filtro="Todos",
+                        fecha_desde="", fecha_hasta="", df=None):
+    """Bytes del informe PDF con estos filtros (df: mantenciones ya filtradas, opcional)."""
+    if df is None:
+        df = consultar_mantenciones(maquina_filtro, responsable_filtro, fecha_desde, fecha_hasta)
 
     if df.empty or 'Fecha' not in df.columns:
         total_mantenimientos = 0
@@ -969,74 +2936,13 @@ def informe_pdf():
         mtbf_global = None
         mttr_global = None
         disponibilidad_global = None
-        detalle = []
     else:
-        df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
-        df = df.dropna(subset=['Fecha'])
-
+        kpis = indicadores_filtrados(df, maquina_filtro, responsable_filtro, fecha_desde, fecha_hasta)
         total_mantenimientos = len(df)
-        total_maquinas = df['Máquina'].nunique() if 'Máquina' in df.columns else 0
-
-        mtbf_global = None
-        if 'Máquina' in df.columns:
-            df_mtbf = df.sort_values(by=['Máquina', 'Fecha'])
-            df_mtbf['DifDias'] = df_mtbf.groupby('Máquina')['Fecha'].diff().dt.days
-            if df_mtbf['DifDias'].notna().any():
-                mtbf_global = round(df_mtbf['DifDias'].dropna().mean(), 1)
-
-        mttr_global = None
-        if 'Duración_horas' in df.columns:
-            df['Duración_horas'] = pd.to_numeric(df['Duración_horas'], errors='coerce')
-            if df['Duración_horas'].notna().any():
-                mttr_global = round(df['Duración_horas'].dropna().mean(), 1)
-
-        disponibilidad_global = None
-        if all(col in df.columns for col in ['Hora_inicio', 'Hora_fin']):
-            df_horas = df.copy()
-            df_horas['Hora_inicio'] = df_horas['Hora_inicio'].fillna('')
-            df_horas['Hora_fin'] = df_horas['Hora_fin'].fillna('')
-
-            df_horas['Inicio_dt'] = pd.to_datetime(
-                df_horas['Fecha'].dt.strftime('%Y-%m-%d') + ' ' + df_horas['Hora_inicio'],
-                errors='coerce'
-            )
-            df_horas['Fin_dt'] = pd.to_datetime(
-                df_horas['Fecha'].dt.strftime('%Y-%m-%d') + ' ' + df_horas['Hora_fin'],
-                errors='coerce'
-            )
-
-            mask = df_horas['Inicio_dt'].notna() & df_horas['Fin_dt'].notna()
-            df_valid = df_horas[mask].copy()
-
-            if not df_valid.empty:
-                df_valid['Downtime_horas'] = (
-                    df_valid['Fin_dt'] - df_valid['Inicio_dt']
-                ).dt.total_seconds() / 3600.0
-                df_valid['Downtime_horas'] = df_valid['Downtime_horas'].clip(lower=0)
-
-                fecha_min = df_valid['Fecha'].min()
-                fecha_max = df_valid['Fecha'].max()
-                dias_periodo = (fecha_max - fecha_min).days + 1
-                horas_totales = dias_periodo * 24
-
-                downtime_total = df_valid['Downtime_horas'].sum()
-                if horas_totales > 0:
-                    disponibilidad_global = round(
-                        (horas_totales - downtime_total) / horas_totales * 100, 2
-                    )
-
-        detalle = []
-        for _, row in df.sort_values('Fecha').iterrows():
-            fecha_str = row['Fecha'].strftime('%d-%m-%Y')
-            maquina = row.get('Máquina', '')
-            tipo = row.get('Tipo', '')
-            resp = row.get('Responsable', '')
-            dur = row.get('Duración_horas', '')
-            if pd.isna(dur):
-                dur_str = '-'
-            else:
-                dur_str = str(dur)
-            detalle.append([fecha_str, maquina, tipo, resp, dur_str])
+        total_maquinas = kpis['total_maquinas']
+        mtbf_global = kpis['mtbf']
+        mttr_global = kpis['mttr']
+        disponibilidad_global = kpis['disponibilidad']
 
     buffer = io.BytesIO()
     c = canvas.Canvas(buffer, pagesize=A4)
@@ -1044,38 +2950,44 @@ def informe_pdf():
 
     header_height = 30 * mm
     azul_wintec = colors.HexColor("#1F3B8F")
-    logo_path = os.path.join(app.root_path, 'static', 'logo_wintec.png')
+    logo = logo_informe()
+
+    # El encabezado es igual en todas las páginas: se dibuja una vez como
+    # form XObject y cada página solo lo referencia
+    c.beginForm("encabezado")
+    c.setFillColor(azul_wintec)
+    c.rect(0, height - header_height, width, header_height, fill=1, stroke=0)
+
+    c.setStrokeColor(colors.white)
+    c.setLineWidth(1)
+    c.line(0, height - header_height, width, height - header_height)
+
+    if logo is not None:
+        c.drawImage(
+            logo,
+            15 * mm,
+            height - header_height + 6 * mm,
+            width=45 * mm,
+            height=20 * mm,
+            preserveAspectRatio=True,
+            mask='auto'
+        )
 
-    def dibujar_header():
-        c.setFillColor(azul_wintec)
-        c.rect(0, height - header_height, width, header_height, fill=1, stroke=0)
-
-        c.setStrokeColor(colors.white)
-        c.setLineWidth(1)
-        c.line(0, height - header_height, width, height - header_height)
-
-        if os.path.exists(logo_path):
-            c.drawImage(
-                logo_path,
-                15 * mm,
-                height - header_height + 6 * mm,
-                width=45 * mm,
-                height=20 * mm,
-                preserveAspectRatio=True,
-                mask='auto'
-            )
+    c.setFillColor(colors.white)
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(70 * mm, height - header_height + 16 * mm, "Informe de Mantenimiento")
 
-        c.setFillColor(colors.white)
-        c.setFont("Helvetica-Bold", 16)
-        c.drawString(70 * mm, height - header_height + 16 * mm, "Informe de Mantenimiento")
+    c.setFont("Helvetica-Bold", 9)
+    fecha_str = datetime.now().strftime("%d-%m-%Y %H:%M")
+    c.drawRightString(
+        width - 15 * mm,
+        height - header_height + 8 * mm,
+        f"Generado el: {fecha_str}  |  Usuario: {usuario}  |  Rol: {rol}"
+    )
+    c.endForm()
 
-        c.setFont("Helvetica-Bold", 9)
-        fecha_str = datetime.now().strftime("%d-%m-%Y %H:%M")
-        c.drawRightString(
-            width - 15 * mm,
-            height - header_height + 8 * mm,
-            f"Generado el: {fecha_str}  |  Usuario: {usuario}  |  Rol: {rol}"
-        )
+    def dibujar_header():
+        c.doForm("encabezado")
 
     def dibujar_footer():
         page_num = c.getPageNumber()
@@ -1187,51 +3099,25 @@ def informe_pdf():
 
     # Gráfico 1: Mantenimientos por máquina
     if not df.empty and 'Máquina' in df.columns:
-        conteo = df['Máquina'].fillna("Sin máquina").value_counts().sort_values(ascending=True)
+        conteo = df['Máquina'].astype(object).fillna("Sin máquina").value_counts().sort_values(ascending=True)
 
         if not conteo.empty:
-            fig, ax = plt.subplots(figsize=(6, 2.6))
-            ax.barh(conteo.index, conteo.values, alpha=0.9)
-            ax.set_title("Mantenimientos por máquina", fontsize=10)
-            ax.set_xlabel("Cantidad", fontsize=9)
-            ax.set_ylabel("Máquina", fontsize=9)
-            ax.xaxis.grid(True, linestyle='--', linewidth=0.5, alpha=0.5)
-            ax.tick_params(axis='y', labelsize=8)
-            ax.tick_params(axis='x', labelsize=8)
-            plt.tight_layout()
-
-            graf_buffer = io.BytesIO()
-            fig.savefig(graf_buffer, format='PNG', dpi=130)
-            plt.close(fig)
-            graf_buffer.seek(0)
-
-            img = ImageReader(graf_buffer)
-            c.drawImage(img, 15 * mm, y - graf_height, width=graf_width, height=graf_height)
+            grafico = grafico_barras(
+                conteo.index.tolist(), conteo.values.tolist(), "Mantenimientos por máquina",
+                graf_width, graf_height, horizontal=True, eje_categorias="Máquina"
+            )
+            renderPDF.draw(grafico, c, 15 * mm, y - graf_height)
             y = y - graf_height - 8 * mm
 
     # Gráfico 2: Mantenimientos por tipo
     if not df.empty and 'Tipo' in df.columns:
-        df_tipo = df.copy()
-        df_tipo['Tipo'] = df_tipo['Tipo'].fillna('Sin tipo')
-        conteo_tipo = df_tipo['Tipo'].value_counts()
+        conteo_tipo = df['Tipo'].astype(object).fillna('Sin tipo').value_counts()
 
         if not conteo_tipo.empty:
-            fig2, ax2 = plt.subplots(figsize=(4.5, 2.5))
-            ax2.bar(conteo_tipo.index, conteo_tipo.values, alpha=0.9)
-            ax2.set_title("Mantenimientos por tipo", fontsize=10)
-            ax2.set_xlabel("Tipo", fontsize=9)
-            ax2.set_ylabel("Cantidad", fontsize=9)
-            ax2.grid(axis='y', linestyle='--', linewidth=0.5, alpha=0.5)
-            ax2.tick_params(axis='x', labelsize=8)
-            ax2.tick_params(axis='y', labelsize=8)
-            plt.tight_layout()
-
-            graf_buffer2 = io.BytesIO()
-            fig2.savefig(graf_buffer2, format='PNG', dpi=130)
-            plt.close(fig2)
-            graf_buffer2.seek(0)
-
-            img2 = ImageReader(graf_buffer2)
+            grafico_tipo = grafico_barras(
+                conteo_tipo.index.tolist(), conteo_tipo.values.tolist(), "Mantenimientos por tipo",
+                graf_width - 20 * mm, graf_height, eje_categorias="Tipo"
+            )
 
             min_y = 40 * mm
             if y - graf_height < min_y:
@@ -1244,28 +3130,20 @@ def informe_pdf():
                 c.drawString(15 * mm, y, "Indicadores visuales (continuación)")
                 y -= 10 * mm
 
-            c.drawImage(img2, 25 * mm, y - graf_height, width=graf_width - 20 * mm, height=graf_height)
+            renderPDF.draw(grafico_tipo, c, 25 * mm, y - graf_height)
             y = y - graf_height - 8 * mm
 
     dibujar_footer()
     c.showPage()
 
     # -------- DETALLE MULTIPÁGINA --------
-    encabezado_detalle = ["Fecha", "Máquina", "Tipo", "Responsable", "Duración (h)"]
-    filas_por_pagina = 25
-    start = 0
-
-    while True:
-        page_rows = detalle[start:start + filas_por_pagina]
-        if not page_rows:
-            break
-
+    for numero, page_rows in enumerate(paginas_detalle_pdf(df)):
         dibujar_header()
         c.setFillColor(colors.black)
         y = height - header_height - 20 * mm
 
         titulo_detalle = "Detalle de mantenimientos"
-        if start > 0:
+        if numero > 0:
             titulo_detalle += " (continuación)"
 
         c.setFont("Helvetica-Bold", 11)
@@ -1275,37 +3153,14 @@ def informe_pdf():
         c.line(15 * mm, y, width - 15 * mm, y)
         y -= 8 * mm
 
-        datos_pagina = [encabezado_detalle] + page_rows
-        tabla_detalle = Table(
-            datos_pagina,
-            colWidths=[25 * mm, 35 * mm, 35 * mm, 40 * mm, 25 * mm]
-        )
-
-        style_detalle = [
-            ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 8),
-            ('FONT', (0, 1), (-1, -1), 'Helvetica', 8),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('ALIGN', (0, 1), (0, -1), 'CENTER'),
-            ('ALIGN', (-1, 1), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#F0F0F0")),
-        ]
-
-        row_count = len(datos_pagina)
-        for row in range(1, row_count):
-            if row % 2 == 0:
-                style_detalle.append(('BACKGROUND', (0, row), (-1, row), colors.whitesmoke))
-
-        tabla_detalle.setStyle(TableStyle(style_detalle))
+        tabla_detalle = Table([ENCABEZADO_DETALLE_PDF] + page_rows, colWidths=ANCHOS_DETALLE_PDF)
+        tabla_detalle.setStyle(ESTILO_DETALLE_PDF)
         w_tab2, h_tab2 = tabla_detalle.wrap(width - 30 * mm, y)
         tabla_detalle.drawOn(c, 15 * mm, y - h_tab2)
 
         dibujar_footer()
         c.showPage()
 
-        start += filas_por_pagina
-
     # -------- PÁGINA FINAL: FIRMAS --------
     dibujar_header()
     c.setFillColor(colors.black)
@@ -1332,18 +3187,356 @@ def informe_pdf():
     c.showPage()
     c.save()
 
-    buffer.seek(0)
+    return buffer.getvalue()
+
+
+
+# ===================== INFORMES PDF EN SEGUNDO PLANO =====================
+
+# Informes terminados, guardados por clave (filtros, versión de datos, usuario)
+INFORMES_DIR = os.getenv("MANTENCIONES_INFORMES_DIR", "informes_pdf")
+MAX_INFORMES_DISCO = int(os.getenv("MANTENCIONES_MAX_INFORMES", "200"))
+# Hilos que generan informes y trabajos que pueden esperar en cola
+WORKERS_INFORMES = int(os.getenv("MANTENCIONES_WORKERS_PDF", "2"))
+MAX_INFORMES_EN_COLA = int(os.getenv("MANTENCIONES_COLA_PDF", "20"))
+
+_pool_informes = ThreadPoolExecutor(max_workers=WORKERS_INFORMES, thread_name_prefix="informe_pdf")
+_trabajos = {}
+_trabajos_lock = threading.Lock()
+
+
+def filtros_informe(args):
+    """Filtros del informe desde los parámetros de la URL, con sus valores por defecto."""
+    return {
+        'maquina_filtro': args.get("maquina", "Todas"),
+        'responsable_filtro': args.get("responsable", "Todos"),
+        'fecha_desde': args.get("fecha_desde", ""),
+        'fecha_hasta': args.get("fecha_hasta", "")
+    }
+
+
+def clave_informe(usuario, rol, filtros):
+    """Identificador del informe: hash de filtros, versión de los datos del backend y usuario."""
+    clave = (sorted(filtros.items()), obtener_almacen().firma(), usuario, rol)
+    return hashlib.sha1(repr(clave).encode('utf-8')).hexdigest()
+
+
+def _ruta_informe(clave):
+    return os.path.abspath(os.path.join(INFORMES_DIR, f"{clave}.pdf"))
+
+
+def _ruta_propietario(clave):
+    return os.path.abspath(os.path.join(INFORMES_DIR, f"{clave}.json"))
+
+
+def _propietario_informe(clave):
+    """Usuario y rol dueños del informe en disco (<clave>.json); None si no se puede leer."""
+    try:
+        with open(_ruta_propietario(clave), encoding='utf-8') as f:
+            propietario = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return propietario if isinstance(propietario, dict) else None
+
+
+def _guardar_informe(clave, contenido, usuario, rol):
+    """Guarda el PDF y su dueño (<clave>.json) en la caché de disco, con tope MAX_INFORMES_DISCO."""
+    os.makedirs(INFORMES_DIR, exist_ok=True)
+    ruta = _ruta_informe(clave)
+    sufijo = f"{threading.get_ident()}.tmp"
+
+    tmp = f"{_ruta_propietario(clave)}.{sufijo}"
+    with open(tmp, "w", encoding='utf-8') as f:
+        json.dump({'usuario': usuario, 'rol': rol}, f)
+    os.replace(tmp, _ruta_propietario(clave))
+
+    tmp = f"{ruta}.{sufijo}"
+    with open(tmp, "wb") as f:
+        f.write(contenido)
+    os.replace(tmp, ruta)
+
+    informes = sorted(
+        (os.path.join(INFORMES_DIR, nombre) for nombre in os.listdir(INFORMES_DIR) if nombre.endswith(".pdf")),
+        key=os.path.getmtime
+    )
+    for viejo in informes[:-MAX_INFORMES_DISCO]:
+        for archivo in (viejo, viejo[:-len(".pdf")] + ".json"):
+            try:
+                os.remove(archivo)
+            except OSError:
+                pass
+    return ruta
+
+
+def obtener_informe(usuario, rol, filtros):
+    """Ruta del informe en disco: si no está en la caché se genera en este hilo."""
+    clave = clave_informe(usuario, rol, filtros)
+    ruta = _ruta_informe(clave)
+    if os.path.exists(ruta):
+        return ruta
+    return _guardar_informe(clave, generar_informe_pdf(usuario, rol, **filtros), usuario, rol)
+
+
+def _ejecutar_trabajo(trabajo):
+    with _trabajos_lock:
+        trabajo.update(estado='en_proceso', inicio=time.time())
+    try:
+        contenido = generar_informe_pdf(trabajo['usuario'], trabajo['rol'], **trabajo['filtros'])
+        _guardar_informe(trabajo['id'], contenido, trabajo['usuario'], trabajo['rol'])
+        with _trabajos_lock:
+            trabajo.update(estado='listo', fin=time.time())
+    except Exception as e:
+        app.logger.exception("Error generando el informe %s", trabajo['id'])
+        with _trabajos_lock:
+            trabajo.update(estado='error', fin=time.time(), error=str(e))
+
+
+def encolar_informe(usuario, rol, filtros):
+    """Encola el informe en el pool o reutiliza el existente; None si la cola está llena."""
+    clave = clave_informe(usuario, rol, filtros)
+    with _trabajos_lock:
+        trabajo = _trabajos.get(clave)
+        if trabajo and trabajo['estado'] in ('pendiente', 'en_proceso', 'listo'):
+            if trabajo['estado'] != 'listo' or os.path.exists(_ruta_informe(clave)):
+                return trabajo
+
+        ahora = time.time()
+        if os.path.exists(_ruta_informe(clave)):
+            trabajo = {'id': clave, 'estado': 'listo', 'usuario': usuario, 'rol': rol,
+                       'filtros': filtros, 'creado': ahora, 'inicio': None, 'fin': ahora, 'error': None}
+            _trabajos[clave] = trabajo
+            return trabajo
+
+        en_cola = sum(1 for t in _trabajos.values() if t['estado'] in ('pendiente', 'en_proceso'))
+        if en_cola >= MAX_INFORMES_EN_COLA:
+            return None
+
+        # Se olvidan los trabajos terminados más antiguos para que el registro no crezca sin límite
+        terminados = [t for t in _trabajos.values() if t['estado'] in ('listo', 'error')]
+        for viejo in sorted(terminados, key=lambda t: t['creado'])[:-MAX_INFORMES_DISCO]:
+            _trabajos.pop(viejo['id'], None)
+
+        trabajo = {'id': clave, 'estado': 'pendiente', 'usuario': usuario, 'rol': rol,
+                   'filtros': filtros, 'creado': ahora, 'inicio': None, 'fin': None, 'error': None}
+        _trabajos[clave] = trabajo
+
+    _pool_informes.submit(_ejecutar_trabajo, trabajo)
+    return trabajo
+
+
+def estado_trabajo(trabajo):
+    """Datos públicos de un trabajo de informe (para la API de estado)."""
+    estado = {
+        'id': trabajo['id'],
+        'estado': trabajo['estado'],
+        'creado': trabajo['creado'],
+        'segundos': round(trabajo['fin'] - trabajo['inicio'], 2) if trabajo['fin'] and trabajo['inicio'] else None,
+        'error': trabajo['error'],
+        'url_estado': url_for('estado_informe', id_trabajo=trabajo['id']),
+        'url_descarga': url_for('descargar_informe', id_trabajo=trabajo['id'])
+    }
+    return estado
+
+
+def _trabajo_de_sesion(id_trabajo):
+    """Trabajo del usuario de la sesión, en memoria o en disco con su dueño; None si no."""
+    if len(id_trabajo) != 40 or any(ch not in "0123456789abcdef" for ch in id_trabajo):
+        return None
+    with _trabajos_lock:
+        trabajo = _trabajos.get(id_trabajo)
+    if trabajo is None and os.path.exists(_ruta_informe(id_trabajo)):
+        propietario = _propietario_informe(id_trabajo)
+        if propietario is None:
+            return None
+        trabajo = {'id': id_trabajo, 'estado': 'listo', 'usuario': propietario.get('usuario'),
+                   'rol': propietario.get('rol'), 'creado': None, 'inicio': None, 'fin': None, 'error': None}
+    if trabajo is None:
+        return None
+    if trabajo['usuario'] != session.get("usuario", "admin") and session.get("rol") != "admin":
+        return None
+    return trabajo
+
+
+@app.route('/informes/<id_trabajo>/estado')
+def estado_informe(id_trabajo):
+    if not session.get("logged_in"):
+        return jsonify({"error": "No autenticado"}), 401
+    trabajo = _trabajo_de_sesion(id_trabajo)
+    if trabajo is None:
+        return jsonify({"error": "Informe no encontrado"}), 404
+    return jsonify(estado_trabajo(trabajo))
+
+
+@app.route('/informes/<id_trabajo>/descargar')
+def descargar_informe(id_trabajo):
+    if not session.get("logged_in"):
+        return redirect(url_for("login"))
+    trabajo = _trabajo_de_sesion(id_trabajo)
+    if trabajo is None:
+        return jsonify({"error": "Informe no encontrado"}), 404
+    if trabajo['estado'] != 'listo':
+        return jsonify(estado_trabajo(trabajo)), 409
     return send_file(
-        buffer,
+        _ruta_informe(id_trabajo),
         as_attachment=True,
         download_name="informe_mantenimiento.pdf",
         mimetype="application/pdf"
     )
 
 
+# ===================== INFORMES PDF POR MÁQUINA (LOTE) =====================
+
+# Procesos que renderizan informes en paralelo (por defecto uno por núcleo).
+# Se crean con spawn: no heredan los hilos ni los locks tomados del servidor.
+PROCESOS_INFORMES = int(os.getenv("MANTENCIONES_PROCESOS_PDF", "0")) or os.cpu_count() or 1
+_contexto_procesos = multiprocessing.get_context("spawn")
+
+# Un lote a la vez por proceso: ya ocupa todos los núcleos
+_lote_en_curso = threading.Lock()
+
+
+def rango_mes(mes):
+    """Primer y último día ('YYYY-MM-DD') de un mes 'YYYY-MM'; ValueError si no es válido."""
+    inicio = datetime.strptime(mes, "%Y-%m")
+    fin = (inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return inicio.strftime("%Y-%m-%d"), fin.strftime("%Y-%m-%d")
+
+
+def _nombre_informe_maquina(maquina, usados):
+    """Nombre de archivo del informe de una máquina, único dentro del ZIP."""
+    base = "informe_" + (re.sub(r"[^\w\-]+", "_", maquina).strip("_") or "sin_nombre")
+    nombre, n = base, 1
+    while nombre in usados:
+        n += 1
+        nombre = f"{base}_{n}"
+    usados.add(nombre)
+    return nombre + ".pdf"
+
+
+def _renderizar_informe_maquina(usuario, rol, filtros, df):
+    """Trabajo de un proceso del lote: el PDF de una máquina y su tiempo de render."""
+    inicio = time.perf_counter()
+    contenido = generar_informe_pdf(usuario, rol, df=df, **filtros)
+    return contenido, time.perf_counter() - inicio
+
+
+def informes_por_maquina(usuario, rol, filtros, procesos=None):
+    """Un informe por máquina en un pool de procesos; entrega cada resultado al terminar."""
+    df = consultar_mantenciones(None, filtros['responsable_filtro'], filtros['fecha_desde'], filtros['fecha_hasta'])
+    if df.empty or 'Máquina' not in df.columns:
+        return
+
+    usados = set()
+    grupos = [
+        (str(maquina), _nombre_informe_maquina(str(maquina), usados), grupo)
+        for maquina, grupo in df.groupby('Máquina', observed=True, sort=True)
+    ]
+    if not grupos:
+        return
+
+    pool = ProcessPoolExecutor(
+        max_workers=min(procesos or PROCESOS_INFORMES, len(grupos)),
+        mp_context=_contexto_procesos
+    )
+    try:
+        futuros = {
+            pool.submit(_renderizar_informe_maquina, usuario, rol, dict(filtros, maquina_filtro=maquina), grupo):
+                (maquina, archivo, len(grupo))
+            for maquina, archivo, grupo in grupos
+        }
+        for futuro in as_completed(futuros):
+            maquina, archivo, registros = futuros[futuro]
+            resultado = {'maquina': maquina, 'archivo': archivo, 'registros': registros,
+                         'pdf': None, 'segundos': None, 'error': None}
+            try:
+                resultado['pdf'], resultado['segundos'] = futuro.result()
+            except Exception as e:
+                app.logger.exception("Error generando el informe de %s", maquina)
+                resultado['error'] = str(e) or type(e).__name__
+            else:
+                app.logger.info("Informe de %s: %d registros en %.2f s", maquina, registros, resultado['segundos'])
+            yield resultado
+    finally:
+        # Si se corta la descarga no se siguen renderizando los pendientes
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _SalidaZip:
+    """Destino de zipfile que retiene los bytes escritos hasta que se entregan."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b"".join(self.partes)
+        self.partes = []
+        return datos
+
+
+def zip_informes(resultados):
+    """ZIP en streaming con los PDF de los resultados y un resumen.csv."""
+    salida = _SalidaZip()
+    resumen = io.StringIO()
+    escritor = csv.writer(resumen, delimiter=';', lineterminator='\n')
+    escritor.writerow(["Máquina", "Archivo", "Registros", "Segundos", "Error"])
+    inicio = time.perf_counter()
+
+    # Los PDF ya vienen comprimidos: se guardan sin volver a comprimir
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_STORED) as archivo:
+        for resultado in resultados:
+            if resultado['pdf'] is not None:
+                archivo.writestr(resultado['archivo'], resultado['pdf'])
+            segundos = resultado['segundos']
+            escritor.writerow([
+                resultado['maquina'], resultado['archivo'] if resultado['pdf'] is not None else "",
+                resultado['registros'], "" if segundos is None else f"{segundos:.2f}", resultado['error'] or ""
+            ])
+            yield salida.vaciar()
+        escritor.writerow(["Total", "", "", f"{time.perf_counter() - inicio:.2f}", ""])
+        archivo.writestr("resumen.csv", '\ufeff' + resumen.getvalue())
+    yield salida.vaciar()
+
+
+@app.route('/informes/maquinas.zip')
+def informes_maquinas():
+    """Un informe PDF por máquina en un ZIP (filtros de /informe_pdf, o ?mes=YYYY-MM)."""
+    if not session.get("logged_in"):
+        return redirect(url_for("login"))
+
+    usuario = session.get("usuario", "admin")
+    rol = session.get("rol", "admin")
+    filtros = filtros_informe(request.args)
+
+    mes = request.args.get("mes", "").strip()
+    if mes:
+        try:
+            filtros['fecha_desde'], filtros['fecha_hasta'] = rango_mes(mes)
+        except ValueError:
+            return jsonify({"error": "Mes inválido, se espera YYYY-MM."}), 400
+
+    if not _lote_en_curso.acquire(blocking=False):
+        return jsonify({"error": "Ya se está generando un lote de informes, intenta en unos minutos."}), 503
+
+    respuesta = Response(zip_informes(informes_por_maquina(usuario, rol, filtros)), mimetype="application/zip")
+    respuesta.call_on_close(_lote_en_curso.release)
+    respuesta.headers["Content-Disposition"] = (
+        f'attachment; filename="informes_maquinas_{mes or datetime.now().strftime("%Y-%m-%d")}.zip"'
+    )
+    return respuesta
+
+
 # ===================== ANÁLISIS POR MÁQUINA =====================
 
 @app.route('/maquinas')
+@respuesta_condicional
+@vista_cacheada(por_usuario=True)
 def maquinas():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
@@ -1370,7 +3563,6 @@ def maquinas():
             rol=session.get("rol")
         )
 
-    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
     df = df.dropna(subset=['Fecha'])
 
     maquinas = sorted(df['Máquina'].dropna().unique().tolist())
@@ -1406,55 +3598,15 @@ def maquinas():
     if 'Duración_horas' not in sub.columns:
         sub['Duración_horas'] = None
 
-    sub['Duración_horas'] = pd.to_numeric(sub['Duración_horas'], errors='coerce')
-
-    total_mant = len(sub)
-    total_corr = int((sub['Tipo'] == 'Correctivo').sum()) if 'Tipo' in sub.columns else 0
-    total_prev = int((sub['Tipo'] == 'Preventivo').sum()) if 'Tipo' in sub.columns else 0
-
-    mtbf = None
-    if total_mant > 1:
-        sub_mtbf = sub.sort_values(by='Fecha')
-        sub_mtbf['DifDias'] = sub_mtbf['Fecha'].diff().dt.days
-        if sub_mtbf['DifDias'].notna().any():
-            mtbf = round(sub_mtbf['DifDias'].dropna().mean(), 1)
-
-    mttr = None
-    if sub['Duración_horas'].notna().any():
-        mttr = round(sub['Duración_horas'].dropna().mean(), 1)
-
-    disponibilidad = None
-    if 'Hora_inicio' in sub.columns and 'Hora_fin' in sub.columns:
-        sh = sub.copy()
-        sh['Hora_inicio'] = sh['Hora_inicio'].fillna('')
-        sh['Hora_fin'] = sh['Hora_fin'].fillna('')
-
-        sh['Inicio_dt'] = pd.to_datetime(
-            sh['Fecha'].dt.strftime('%Y-%m-%d') + ' ' + sh['Hora_inicio'],
-            errors='coerce'
-        )
-        sh['Fin_dt'] = pd.to_datetime(
-            sh['Fecha'].dt.strftime('%Y-%m-%d') + ' ' + sh['Hora_fin'],
-            errors='coerce'
-        )
-
-        mask = sh['Inicio_dt'].notna() & sh['Fin_dt'].notna()
-        sv = sh[mask].copy()
-
-        if not sv.empty:
-            sv['Downtime_horas'] = (sv['Fin_dt'] - sv['Inicio_dt']).dt.total_seconds() / 3600.0
-            sv['Downtime_horas'] = sv['Downtime_horas'].clip(lower=0)
-
-            fecha_min = sv['Fecha'].min()
-            fecha_max = sv['Fecha'].max()
-            dias_periodo = (fecha_max - fecha_min).days + 1
-            horas_totales = dias_periodo * 24
+    sub['Duración_horas'] = horas_float(sub['Duración_horas'])
 
-            downtime_total = sv['Downtime_horas'].sum()
-            if horas_totales > 0:
-                disponibilidad = round(
-                    (horas_totales - downtime_total) / horas_totales * 100, 2
-                )
+    kpis = kpis_maquina(indicadores_mantenciones(), maquina_sel)
+    total_mant = int(kpis['Fallas'] or 0)
+    total_corr = int(kpis['Correctivos'] or 0)
+    total_prev = int(kpis['Preventivos'] or 0)
+    mtbf = kpis['MTBF_dias']
+    mttr = kpis['MTTR_horas']
+    disponibilidad = kpis['Disponibilidad']
 
     hist = (
         sub.groupby(sub['Fecha'].dt.strftime('%Y-%m-%d'))
@@ -1503,6 +3655,8 @@ def maquinas():
 
 
 @app.route('/maquina/<maquina>')
+@respuesta_condicional
+@vista_cacheada()
 def maquina_detalle(maquina):
     if not session.get("logged_in"):
         return redirect(url_for("login"))
@@ -1520,13 +3674,11 @@ def maquina_detalle(maquina):
         flash(f"No se encontraron registros para la máquina '{maquina}'.", "warning")
         return redirect(url_for('maquinas'))
 
-    if 'Fecha' in df.columns:
-        df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
-    else:
+    if 'Fecha' not in df.columns:
         df['Fecha'] = pd.NaT
 
     if 'Duración_horas' in df.columns:
-        df['Duración_horas'] = pd.to_numeric(df['Duración_horas'], errors='coerce')
+        df['Duración_horas'] = horas_float(df['Duración_horas'])
     else:
         df['Duración_horas'] = None
 
@@ -1540,50 +3692,10 @@ def maquina_detalle(maquina):
     fecha_primera = df['Fecha'].min()
     fecha_ultima = df['Fecha'].max()
 
-    mtbf = None
-    if df['Fecha'].notna().sum() >= 2:
-        dif = df['Fecha'].diff().dt.days
-        if dif.notna().any():
-            mtbf = round(dif.dropna().mean(), 1)
-
-    mttr = None
-    if df['Duración_horas'].notna().any():
-        mttr = round(df['Duración_horas'].dropna().mean(), 1)
-
-    disponibilidad = None
-    if df['Fecha'].notna().any():
-        g_horas = df.copy()
-        g_horas['Hora_inicio'] = g_horas['Hora_inicio'].fillna('')
-        g_horas['Hora_fin'] = g_horas['Hora_fin'].fillna('')
-
-        g_horas['Inicio_dt'] = pd.to_datetime(
-            g_horas['Fecha'].dt.strftime('%Y-%m-%d') + ' ' + g_horas['Hora_inicio'],
-            errors='coerce'
-        )
-        g_horas['Fin_dt'] = pd.to_datetime(
-            g_horas['Fecha'].dt.strftime('%Y-%m-%d') + ' ' + g_horas['Hora_fin'],
-            errors='coerce'
-        )
-
-        mask = g_horas['Inicio_dt'].notna() & g_horas['Fin_dt'].notna()
-        g_valid = g_horas[mask].copy()
-
-        if not g_valid.empty:
-            g_valid['Downtime_horas'] = (
-                g_valid['Fin_dt'] - g_valid['Inicio_dt']
-            ).dt.total_seconds() / 3600.0
-            g_valid['Downtime_horas'] = g_valid['Downtime_horas'].clip(lower=0)
-
-            fecha_min = g_horas['Fecha'].min()
-            fecha_max = g_horas['Fecha'].max()
-            dias_periodo = (fecha_max - fecha_min).days + 1
-            horas_totales = dias_periodo * 24
-
-            downtime_total = g_valid['Downtime_horas'].sum()
-            if horas_totales > 0:
-                disponibilidad = round(
-                    (horas_totales - downtime_total) / horas_totales * 100, 2
-                )
+    kpis = kpis_maquina(indicadores_mantenciones(), maquina)
+    mtbf = kpis['MTBF_dias']
+    mttr = kpis['MTTR_horas']
+    disponibilidad = kpis['Disponibilidad']
 
     historial = df.sort_values(by='Fecha').to_dict(orient='records')
 
@@ -1612,42 +3724,40 @@ def maquina_detalle(maquina):
 # ===================== PREVENTIVOS =====================
 
 @app.route('/preventivos')
+@respuesta_condicional
+@vista_cacheada()
 def preventivos():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
 
-    df = cargar_mantenciones()
+    df, posiciones = cargar_mantenciones_indexadas()
 
     if 'Próximo_mantenimiento' not in df.columns or 'Tipo' not in df.columns:
         flash("No hay información de preventivos.", "warning")
         return redirect(url_for('home'))
 
-    hoy = datetime.now().date()
-    preventivos_list = []
-
-    for i, row in df.iterrows():
-        if row['Tipo'] == 'Preventivo' and pd.notna(row['Próximo_mantenimiento']):
-            prox = datetime.strptime(str(row['Próximo_mantenimiento']), "%Y-%m-%d").date()
-            dias = (prox - hoy).days
-
-            preventivos_list.append({
-                "indice": i,
-                "Máquina": row['Máquina'],
-                "Fecha": row['Fecha'],
-                "Próximo_mantenimiento": row['Próximo_mantenimiento'],
-                "dias": dias,
-                "Estado_prev": (
-                    "Vencido" if dias < 0 else
-                    "Hoy" if dias == 0 else
-                    "Próximo" if dias <= 7 else
-                    "OK"
-                )
-            })
+    # Solo las filas de los preventivos con fecha, ubicadas desde el índice de vencimientos
+    vencimientos = indice_vencimientos()
+    filas = np.sort(posiciones.get_indexer(vencimientos.rango()))
+    df = df.iloc[filas[filas >= 0]]
+
+    dias, estado = semaforo_preventivos(df)
+    aplica = dias.notna()
+    prev = pd.DataFrame({
+        "ID": df.loc[aplica, 'ID'],
+        "Máquina": df.loc[aplica, 'Máquina'].astype(object),
+        "Fecha": df.loc[aplica, 'Fecha'].dt.strftime("%Y-%m-%d").astype(object),
+        "Próximo_mantenimiento": df.loc[aplica, 'Próximo_mantenimiento'].dt.strftime("%Y-%m-%d"),
+        "dias": dias[aplica].astype(int),
+        "Estado_prev": estado[aplica]
+    })
+    preventivos_list = prev.astype(object).where(prev.notna(), None).to_dict(orient='records')
 
-    total = len(preventivos_list)
-    vencidos = len([p for p in preventivos_list if p["Estado_prev"] == "Vencido"])
-    proximos = len([p for p in preventivos_list if p["Estado_prev"] == "Próximo"])
-    ok = len([p for p in preventivos_list if p["Estado_prev"] == "OK"])
+    hoy = _dia(datetime.now().date())
+    total = len(vencimientos)
+    vencidos = vencimientos.contar(hasta=hoy - 1)
+    proximos = vencimientos.contar(hoy + 1, hoy + DIAS_AVISO_PREVENTIVO)
+    ok = vencimientos.contar(desde=hoy + DIAS_AVISO_PREVENTIVO + 1)
 
     return render_template(
         'preventivos.html',
@@ -1669,67 +3779,85 @@ def calendario():
         usuario=session.get("usuario"),
         rol=session.get("rol")
     )
-@app.route('/api/calendario')
-def api_calendario():
-    if not session.get("logged_in"):
-        return redirect(url_for("login"))
+# Colores por tipo en el calendario
+COLORES_CALENDARIO = {'Correctivo': '#dc3545', 'Preventivo': '#007bff'}
+COLOR_CALENDARIO = '#28a745'
+COLOR_PROGRAMADO = '#17a2b8'
 
-    try:
-        df = pd.read_csv("mantenciones.csv")
-    except FileNotFoundError:
-        return jsonify([])
 
-    if 'Fecha' not in df.columns:
-        return jsonify([])
+def _fecha_calendario(valor):
+    """Fecha de los parámetros start/end de FullCalendar (ISO, con o sin hora), o None."""
+    try:
+        return datetime.strptime((valor or "")[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
 
-    # Normalizar fecha
-    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
-    df = df.dropna(subset=['Fecha'])
 
-    eventos = []
+def _eventos_calendario(df, titulo_tipo=None, color=None):
+    """Eventos {title, start, color} de un DataFrame con Máquina, Tipo y Fecha, sin iterar filas."""
+    if df.empty:
+        return []
+    maquina = df['Máquina'].astype(object).fillna('Sin máquina').astype(str) if 'Máquina' in df.columns \
+        else pd.Series('Sin máquina', index=df.index)
+    if titulo_tipo is not None:
+        tipo = pd.Series(titulo_tipo, index=df.index)
+    elif 'Tipo' in df.columns:
+        tipo = df['Tipo'].astype(object).fillna('').astype(str)
+    else:
+        tipo = pd.Series('', index=df.index)
 
-    for _, row in df.iterrows():
-        maquina = str(row.get('Máquina', 'Sin máquina'))
-        tipo = str(row.get('Tipo', ''))
-        fecha = row['Fecha'].date().isoformat()
+    eventos = pd.DataFrame({
+        "title": maquina.where(tipo == '', maquina + ' (' + tipo + ')'),
+        "start": df['Fecha'].dt.strftime('%Y-%m-%d'),
+        "color": color or tipo.map(COLORES_CALENDARIO).fillna(COLOR_CALENDARIO)
+    })
+    return eventos.to_dict(orient='records')
 
-        # Texto que se ve en el día
-        titulo = f"{maquina} ({tipo})" if tipo else maquina
 
-        # Colores por tipo (puedes cambiarlos)
-        color = '#28a745'  # verde por defecto
-        if tipo == 'Correctivo':
-            color = '#dc3545'  # rojo
-        elif tipo == 'Preventivo':
-            color = '#007bff'  # azul
+@app.route('/api/calendario')
+@respuesta_condicional
+@vista_cacheada()
+def api_calendario():
+    """Mantenciones y preventivos programados de la ventana start/end que pide FullCalendar."""
+    if not session.get("logged_in"):
+        return redirect(url_for("login"))
 
-        eventos.append({
-            "title": titulo,
-            "start": fecha,
-            "color": color
-        })
+    desde = _fecha_calendario(request.args.get("start"))
+    hasta = _fecha_calendario(request.args.get("end"))
+    if hasta:
+        hasta -= timedelta(days=1)
 
+    df = consultar_mantenciones(
+        None, None,
+        desde.isoformat() if desde else None,
+        hasta.isoformat() if hasta else None
+    )
+    # Una ventana futura puede no tener registros pero sí preventivos programados
+    eventos = _eventos_calendario(df) if 'Fecha' in df.columns else []
+    eventos += _eventos_calendario(
+        ocurrencias_preventivas(desde, hasta),
+        titulo_tipo='Preventivo programado',
+        color=COLOR_PROGRAMADO
+    )
     return jsonify(eventos)
 
 
-@app.route("/preventivos/marcar/<int:indice>", methods=["POST"])
-def marcar_realizado(indice):
+@app.route("/preventivos/marcar/<int:id_registro>", methods=["POST"])
+def marcar_realizado(id_registro):
     if not session.get("logged_in"):
         return redirect(url_for("login"))
 
-    df = cargar_mantenciones()
+    fila = obtener_mantencion(id_registro)
 
-    if indice < 0 or indice >= len(df):
+    if fila is None:
         flash("No se encontró el registro de preventivo.", "danger")
         return redirect(url_for("preventivos"))
 
-    fila = df.loc[indice]
-
     hoy_date = datetime.now().date()
     hoy_str = hoy_date.strftime("%Y-%m-%d")
 
     freq = 0
-    if "Frecuencia_dias" in df.columns and not pd.isna(fila.get("Frecuencia_dias")):
+    if "Frecuencia_dias" in fila.index and not pd.isna(fila.get("Frecuencia_dias")):
         try:
             freq = int(fila["Frecuencia_dias"])
         except ValueError:
@@ -1738,15 +3866,195 @@ def marcar_realizado(indice):
     proximo_date = hoy_date + timedelta(days=freq)
     proximo_str = proximo_date.strftime("%Y-%m-%d")
 
-    df.at[indice, "Fecha"] = hoy_str
-    df.at[indice, "Próximo_mantenimiento"] = proximo_str
-
-    df.to_csv("mantenciones.csv", index=False)
+    actualizar_mantencion(id_registro, {"Fecha": hoy_str, "Próximo_mantenimiento": proximo_str})
 
     flash("Preventivo marcado como realizado correctamente.", "success")
     return redirect(url_for("preventivos"))
 
 
+# ===================== AVISOS DE PREVENTIVOS POR CORREO =====================
+
+# Correo de cada Responsable (CSV responsable,correo). Los que no tienen
+# correo reciben el aviso en MAIL_AVISOS_SUPERVISOR, si está definido.
+CORREOS_FILE = os.getenv("MANTENCIONES_CORREOS", "correos_responsables.csv")
+CORREO_SUPERVISOR = os.getenv("MAIL_AVISOS_SUPERVISOR")
+REINTENTOS_CORREO = int(os.getenv("MAIL_REINTENTOS", "4"))
+ESPERA_CORREO = float(os.getenv("MAIL_ESPERA_REINTENTO", "5"))
+MAX_CORREOS_EN_COLA = int(os.getenv("MAIL_MAX_EN_COLA", "500"))
+
+
+class ColaCorreos:
+    """Cola de correos con un hilo que los envía, con reintentos y espera exponencial."""
+
+    def __init__(self, app, reintentos=REINTENTOS_CORREO, espera=ESPERA_CORREO, max_en_cola=MAX_CORREOS_EN_COLA):
+        self.app = app
+        self.reintentos = max(reintentos, 1)
+        self.espera = espera
+        self.cola = queue.Queue(maxsize=max_en_cola)
+        self.hilo = None
+        self.lock = threading.Lock()
+        self.contadores = {'enviados': 0, 'reintentos': 0, 'fallidos': 0, 'descartados': 0}
+
+    def encolar(self, mensaje):
+        """Agrega un flask_mail.Message a la cola sin esperar al servidor. False si la cola está llena."""
+        self._iniciar()
+        try:
+            self.cola.put_nowait(mensaje)
+        except queue.Full:
+            self._contar('descartados')
+            self.app.logger.warning("Cola de correos llena, se descarta: %s", mensaje.subject)
+            return False
+        return True
+
+    def esperar(self, timeout=None):
+        """Espera a que se procesen los correos encolados (comandos CLI). False si vence el timeout."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self.cola.all_tasks_done:
+            while self.cola.unfinished_tasks:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self.cola.all_tasks_done.wait(restante)
+        return True
+
+    def estadisticas(self):
+        with self.lock:
+            return dict(self.contadores, en_cola=self.cola.qsize())
+
+    def _contar(self, clave):
+        with self.lock:
+            self.contadores[clave] += 1
+
+    def _iniciar(self):
+        with self.lock:
+            if self.hilo is None or not self.hilo.is_alive():
+                self.hilo = threading.Thread(target=self._trabajar, name="cola_correos", daemon=True)
+                self.hilo.start()
+
+    def _trabajar(self):
+        while True:
+            mensaje = self.cola.get()
+            try:
+                self._enviar(mensaje)
+            finally:
+                self.cola.task_done()
+
+    def _enviar(self, mensaje):
+        for intento in range(1, self.reintentos + 1):
+            try:
+                with self.app.app_context():
+                    mail.send(mensaje)
+                self._contar('enviados')
+                return True
+            except Exception:
+                if intento == self.reintentos:
+                    self._contar('fallidos')
+                    self.app.logger.exception(
+                        "No se pudo enviar el correo a %s tras %d intentos", ", ".join(mensaje.recipients), intento
+                    )
+                    return False
+                self._contar('reintentos')
+                time.sleep(self.espera * 2 ** (intento - 1))
+        return False
+
+
+cola_correos = ColaCorreos(app)
+
+
+def cargar_correos_responsables():
+    """{Responsable normalizado: correo} desde CORREOS_FILE (vacío si no existe)."""
+    correos = {}
+    if not os.path.exists(CORREOS_FILE):
+        return correos
+    with open(CORREOS_FILE, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            responsable = normalizar_texto(row.get('responsable'))
+            correo = (row.get('correo') or '').strip()
+            if responsable and correo:
+                correos[responsable] = correo
+    return correos
+
+
+def avisos_preventivos(hoy=None, dias=DIAS_AVISO_PREVENTIVO):
+    """Preventivos vencidos y por vencer agrupados por Responsable: {responsable: DataFrame}."""
+    hoy = hoy or datetime.now().date()
+    indice = indice_vencimientos()
+    ids = indice.rango(hasta=_dia(hoy) + dias)
+    if not ids:
+        return {}
+
+    df, posiciones = cargar_mantenciones_indexadas()
+    filas = posiciones.get_indexer(ids)
+    df = df.iloc[filas[filas >= 0]]
+
+    faltan = (df['Próximo_mantenimiento'] - pd.Timestamp(hoy)).dt.days
+    avisos = pd.DataFrame({
+        'Responsable': df['Responsable'].astype(object).fillna('Sin responsable') if 'Responsable' in df.columns
+        else 'Sin responsable',
+        'Máquina': df['Máquina'].astype(object).fillna('') if 'Máquina' in df.columns else '',
+        'Descripción': df['Descripción'].astype(object).fillna('') if 'Descripción' in df.columns else '',
+        'Próximo': df['Próximo_mantenimiento'].dt.strftime('%d-%m-%Y'),
+        'dias': faltan,
+        'Estado': np.where(faltan < 0, 'Vencido', 'Por vencer')
+    })
+    return {responsable: grupo.drop(columns='Responsable') for responsable, grupo in avisos.groupby('Responsable')}
+
+
+def mensaje_aviso(responsable, correo, avisos, hoy):
+    """Resumen diario (un solo correo) con los preventivos de un Responsable."""
+    vencidos = avisos[avisos['Estado'] == 'Vencido']
+    por_vencer = avisos[avisos['Estado'] != 'Vencido']
+
+    lineas = [f"Hola {responsable},", "", f"Preventivos a tu cargo al {hoy.strftime('%d-%m-%Y')}:"]
+    for titulo, grupo in (("Vencidos", vencidos), ("Por vencer", por_vencer)):
+        if grupo.empty:
+            continue
+        lineas += ["", f"{titulo} ({len(grupo)}):"]
+        for maquina, descripcion, proximo, faltan in grupo[['Máquina', 'Descripción', 'Próximo', 'dias']].itertuples(
+                index=False):
+            cuando = f"venció hace {-faltan} días" if faltan < 0 else "vence hoy" if faltan == 0 \
+                else f"vence en {faltan} días"
+            lineas.append(f"  - {maquina}: {descripcion} | {proximo} ({cuando})")
+    lineas += ["", "Wintec S.A. - Departamento de Mantenimiento Industrial"]
+
+    return Message(
+        subject=f"Preventivos de {responsable}: {len(vencidos)} vencidos, {len(por_vencer)} por vencer",
+        recipients=[correo],
+        sender=app.config['MAIL_DEFAULT_SENDER'],
+        body="\n".join(lineas)
+    )
+
+
+def encolar_avisos_preventivos(hoy=None, dias=DIAS_AVISO_PREVENTIVO):
+    """Encola un correo por Responsable con sus avisos; devuelve el resumen de lo encolado."""
+    hoy = hoy or datetime.now().date()
+    correos = cargar_correos_responsables()
+    resumen = {'encolados': 0, 'sin_correo': [], 'descartados': 0}
+
+    for responsable, avisos in avisos_preventivos(hoy, dias).items():
+        correo = correos.get(responsable) or CORREO_SUPERVISOR
+        if not correo:
+            resumen['sin_correo'].append(responsable)
+            continue
+        if cola_correos.encolar(mensaje_aviso(responsable, correo, avisos, hoy)):
+            resumen['encolados'] += 1
+        else:
+            resumen['descartados'] += 1
+    return resumen
+
+
+@app.route('/api/avisos_preventivos', methods=['POST'])
+def api_avisos_preventivos():
+    """Encola los avisos del día (solo administrador) y responde de inmediato."""
+    if not requiere_admin():
+        return jsonify({"error": "Solo el administrador"}), 403
+    if not app.config.get('MAIL_DEFAULT_SENDER'):
+        return jsonify({"error": "Correo no configurado (MAIL_DEFAULT_SENDER o MAIL_USERNAME)."}), 503
+    resumen = encolar_avisos_preventivos(dias=_entero(request.args.get("dias"), DIAS_AVISO_PREVENTIVO, 0, 365))
+    resumen['cola'] = cola_correos.estadisticas()
+    return jsonify(resumen), 202
+
+
 # ===================== ADMIN USUARIOS =====================
 
 @app.route('/usuarios')
@@ -1833,6 +4141,189 @@ def eliminar_usuario(usuario_nombre):
     return redirect(url_for("usuarios"))
 
 
+@app.route('/api/cache_vistas')
+def api_cache_vistas():
+    """Contadores de la caché de vistas (solo administrador)."""
+    if not requiere_admin():
+        return jsonify({"error": "Solo el administrador"}), 403
+    return jsonify(cache_vistas.estadisticas())
+
+
+# ===================== COMANDOS CLI =====================
+
+@app.cli.command('migrar-sqlite')
+@click.option('--db', default=None, help="Base destino (por defecto MANTENCIONES_DB o mantenciones.db).")
+@click.option('--forzar', is_flag=True, help="Reemplaza los datos si la base ya tiene mantenciones.")
+def migrar_sqlite(db, forzar):
+    """Copia mantenciones.csv a la base SQLite (migración de una sola vez)."""
+    ruta = db or os.getenv("MANTENCIONES_DB", "mantenciones.db")
+    destino = AlmacenSQLite(ruta)
+
+    if not destino.leer().empty and not forzar:
+        raise click.ClickException(f"{ruta} ya tiene mantenciones; usa --forzar para reemplazarlas.")
+
+    df = asegurar_ids(normalizar_mantenciones(AlmacenCSV(MANTENCIONES_FILE).leer()))
+    destino.escribir(df)
+    click.echo(f"{len(df)} mantenciones migradas a {ruta}. Usa MANTENCIONES_BACKEND=sqlite para activarla.")
+
+
+@app.cli.command('migrar-particiones')
+@click.option('--directorio', default=None, help="Destino (por defecto MANTENCIONES_DIR o mantenciones_particiones).")
+@click.option('--mensual', is_flag=True, help="Una partición por mes en vez de por año.")
+def migrar_particiones(directorio, mensual):
+    """Reparte mantenciones.csv en particiones por año (o mes) con su manifest."""
+    ruta = directorio or os.getenv("MANTENCIONES_DIR", "mantenciones_particiones")
+    destino = AlmacenParticionado(ruta, por_mes=mensual)
+
+    df = asegurar_ids(normalizar_mantenciones(AlmacenCSV(MANTENCIONES_FILE).leer()))
+    destino.escribir(df)
+    particiones = destino._manifest()['particiones']
+    click.echo(
+        f"{len(df)} mantenciones repartidas en {len(particiones)} particiones en {ruta}. "
+        "Usa MANTENCIONES_BACKEND=particionado para activarlas."
+    )
+
+
+@app.cli.command('verificar-kpis')
+def verificar_kpis():
+    """Compara los KPI incrementales con el cálculo completo (y los reconstruye si difieren)."""
+    indicadores_mantenciones()
+    diferencias = verificar_agregados()[1]
+    if diferencias:
+        for diferencia in diferencias:
+            click.echo(diferencia)
+        raise click.ClickException(f"{len(diferencias)} diferencias; acumulados reconstruidos.")
+    click.echo("KPI incrementales consistentes con el cálculo completo.")
+
+
+@app.cli.command('verificar-vencimientos')
+def verificar_vencimientos_cli():
+    """Compara el índice de vencimientos incremental con uno construido desde cero."""
+    indice_vencimientos()
+    diferencias = verificar_vencimientos()[1]
+    if diferencias:
+        for diferencia in diferencias:
+            click.echo(diferencia)
+        raise click.ClickException(f"{len(diferencias)} diferencias; índice reconstruido.")
+    click.echo("Índice de vencimientos consistente con los datos.")
+
+
+@app.cli.command('benchmark-horas')
+@click.option('--filas', default=100_000, show_default=True, help="Registros sintéticos a procesar.")
+@click.option('--repeticiones', default=5, show_default=True)
+def benchmark_horas(filas, repeticiones):
+    """Compara el cálculo de horas de parada vía texto con la aritmética de timedelta."""
+    rng = np.random.default_rng(0)
+    horas = rng.integers(0, 24, filas)
+    df = pd.DataFrame({
+        'Fecha': pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 2000, filas), unit='D'),
+        'Hora_inicio': [f"{h:02d}:{m:02d}" for h, m in zip(horas, rng.integers(0, 60, filas))],
+        'Hora_fin': [f"{h:02d}:{m:02d}" for h, m in zip((horas + rng.integers(1, 4, filas)) % 24, rng.integers(0, 60, filas))]
+    })
+
+    def via_texto():
+        # Camino anterior: strftime + concatenación + to_datetime en cada cálculo
+        inicio = pd.to_datetime(df['Fecha'].dt.strftime('%Y-%m-%d') + ' ' + df['Hora_inicio'], errors='coerce')
+        fin = pd.to_datetime(df['Fecha'].dt.strftime('%Y-%m-%d') + ' ' + df['Hora_fin'], errors='coerce')
+        return ((fin - inicio).dt.total_seconds() / 3600.0).clip(lower=0)
+
+    tipado = tipar_mantenciones(df.copy())
+
+    def mejor(funcion):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        return min(tiempos) * 1000
+
+    texto = mejor(via_texto)
+    parseo = mejor(lambda: tipar_mantenciones(df.copy()))
+    aritmetica = mejor(lambda: horas_parada(tipado))
+    cruzan = int((tipado['Hora_fin'] < tipado['Hora_inicio']).sum())
+
+    click.echo(f"{filas} registros, mejor de {repeticiones}:")
+    click.echo(f"  texto (strftime + concatenación + to_datetime): {texto:8.1f} ms por cálculo")
+    click.echo(f"  timedelta, parseo al cargar (una vez):          {parseo:8.1f} ms")
+    click.echo(f"  timedelta, Fecha + hora por cálculo:            {aritmetica:8.1f} ms por cálculo")
+    click.echo(f"  {cruzan} intervenciones cruzan la medianoche (antes quedaban en 0 h)")
+
+
+@app.cli.command('informes-maquinas')
+@click.option('--mes', default=None, help="Mes YYYY-MM (reemplaza --desde y --hasta).")
+@click.option('--desde', default="", help="Fecha inicial YYYY-MM-DD.")
+@click.option('--hasta', default="", help="Fecha final YYYY-MM-DD (inclusive).")
+@click.option('--responsable', default="Todos")
+@click.option('--salida', default=None, help="ZIP destino (por defecto informes_maquinas_<mes o fecha>.zip).")
+@click.option('--procesos', default=None, type=int, help="Procesos en paralelo (por defecto MANTENCIONES_PROCESOS_PDF o núcleos).")
+@click.option('--usuario', default="admin", show_default=True, help="Usuario que figura en los informes.")
+def informes_maquinas_cli(mes, desde, hasta, responsable, salida, procesos, usuario):
+    """Genera un informe PDF por máquina en un ZIP, con el tiempo de cada uno."""
+    if mes:
+        try:
+            desde, hasta = rango_mes(mes)
+        except ValueError:
+            raise click.BadParameter("se espera YYYY-MM", param_hint="--mes")
+    filtros = {'maquina_filtro': "Todas", 'responsable_filtro': responsable,
+               'fecha_desde': desde, 'fecha_hasta': hasta}
+    salida = salida or f"informes_maquinas_{mes or datetime.now().strftime('%Y-%m-%d')}.zip"
+
+    inicio = time.perf_counter()
+    informes, errores, render = 0, 0, 0.0
+
+    def con_avance(resultados):
+        nonlocal informes, errores, render
+        for resultado in resultados:
+            if resultado['error']:
+                errores += 1
+                click.echo(f"  {resultado['maquina']:<30} {resultado['registros']:>7} registros  ERROR: {resultado['error']}")
+            else:
+                informes += 1
+                render += resultado['segundos']
+                click.echo(f"  {resultado['maquina']:<30} {resultado['registros']:>7} registros  {resultado['segundos']:7.2f} s")
+            yield resultado
+
+    with open(salida, "wb") as f:
+        for bloque in zip_informes(con_avance(informes_por_maquina(usuario, "admin", filtros, procesos))):
+            f.write(bloque)
+
+    total = time.perf_counter() - inicio
+    click.echo(f"{informes} informes en {salida}: {total:.2f} s en total, {render:.2f} s sumando cada informe.")
+    if errores:
+        raise click.ClickException(f"{errores} informes con error (ver resumen.csv en el ZIP).")
+
+
+@app.cli.command('avisos-preventivos')
+@click.option('--dias', default=DIAS_AVISO_PREVENTIVO, show_default=True, help="Días de anticipación para 'por vencer'.")
+@click.option('--timeout', default=600, show_default=True, help="Segundos máximos esperando el envío.")
+def avisos_preventivos_cli(dias, timeout):
+    """Envía a cada Responsable un resumen de sus preventivos vencidos y por vencer."""
+    if not app.config.get('MAIL_DEFAULT_SENDER'):
+        raise click.ClickException("Correo no configurado: define MAIL_DEFAULT_SENDER o MAIL_USERNAME.")
+    resumen = encolar_avisos_preventivos(dias=dias)
+    if resumen['sin_correo']:
+        click.echo(f"Sin correo (ver {CORREOS_FILE}): {', '.join(resumen['sin_correo'])}")
+    # El hilo de la cola es daemon: el comando espera a que termine antes de salir
+    if not cola_correos.esperar(timeout):
+        raise click.ClickException(f"Quedaron correos sin procesar tras {timeout} s.")
+    estadisticas = cola_correos.estadisticas()
+    click.echo(f"{estadisticas['enviados']} avisos enviados, {estadisticas['reintentos']} reintentos, "
+               f"{estadisticas['fallidos']} fallidos.")
+    if estadisticas['fallidos']:
+        raise click.ClickException("Algunos avisos no se pudieron enviar.")
+
+
+@app.cli.command('compactar-mantenciones')
+def compactar_mantenciones():
+    """Reescribe mantenciones.csv completo (une los registros agregados al final)."""
+    almacen = obtener_almacen()
+    if not isinstance(almacen, AlmacenCSV):
+        raise click.ClickException("La compactación solo aplica al backend CSV.")
+    almacen.compactar()
+    _invalidar_cache()
+    click.echo(f"{MANTENCIONES_FILE} compactado.")
+
+
 # ===================== UTILIDAD =====================
 
 def requiere_admin():
@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+
+BACKENDS = ['csv', 'sqlite', 'particionado']
+
+
+def fila(maquina="Selladora", fecha="2025-03-10", tipo="Correctivo", **extra):
+    """Mantención de prueba con los campos que pide el formulario."""
+    datos = {
+        'Máquina': maquina,
+        'Fecha': fecha,
+        'Descripción': "prueba",
+        'Responsable': "Ana",
+        'Hora_inicio': "08:00",
+        'Hora_fin': "10:30",
+        'Duración_horas': None,
+        'Tipo': tipo,
+        'Frecuencia_dias': None,
+        'Próximo_mantenimiento': None
+    }
+    datos.update(extra)
+    return datos
+
+
+@pytest.fixture
+def preparar(tmp_path, monkeypatch):
+    """Deja la app en un directorio vacío con el backend pedido y sin estado de otras pruebas."""
+    def _preparar(backend='csv'):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("MANTENCIONES_BACKEND", backend)
+        monkeypatch.setattr(aplicacion, "_almacen", None)
+        monkeypatch.setattr(aplicacion, "_cache_mantenciones",
+                            {'firma': None, 'df': None, 'posiciones': None, 'lectura': None, 'filtros': None})
+        monkeypatch.setattr(aplicacion, "_agregados", {'firma': None, 'datos': None, 'pendientes_verificar': 0})
+        monkeypatch.setattr(aplicacion, "_vencimientos", {'firma': None, 'datos': None, 'pendientes_verificar': 0})
+        aplicacion.cache_vistas.limpiar()
+        aplicacion.app.config['TESTING'] = True
+        return aplicacion
+    return _preparar
+
+
+@pytest.fixture
+def cliente(preparar):
+    """Cliente de pruebas con sesión de admin sobre el backend CSV."""
+    preparar('csv')
+    cliente = aplicacion.app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion.update(logged_in=True, usuario="admin", rol="admin")
+    return cliente
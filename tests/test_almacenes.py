@@ -0,0 +1,89 @@
+import pytest
+from pandas.testing import assert_frame_equal
+
+from conftest import BACKENDS, fila
+
+
+def test_particionado_poda_las_consultas_por_fecha(preparar, monkeypatch):
+    app = preparar('particionado')
+    for anio in (2023, 2024, 2025):
+        app.insertar_mantencion(fila(fecha=f"{anio}-06-15"))
+    app.cargar_mantenciones()
+    assert app.cache_vigente()
+
+    almacen = app.obtener_almacen()
+    leer = almacen._leer
+    leidas = []
+    monkeypatch.setattr(almacen, "_leer", lambda claves=None: leidas.append(claves) or leer(claves))
+
+    df = app.consultar_mantenciones(fecha_desde="2024-01-01", fecha_hasta="2024-12-31")
+    assert leidas == [['2024']]
+    assert df['Fecha'].dt.year.tolist() == [2024]
+
+
+def _registros(app):
+    """Mantenciones tal como se guardan, ordenadas por ID, para comparar lecturas."""
+    df = app.serializar_mantenciones(app.cargar_mantenciones())
+    return df.sort_values('ID').reset_index(drop=True)
+
+
+def _escrituras(app):
+    ids = [app.insertar_mantencion(fila(fecha=f"202{4 + i % 2}-0{i % 9 + 1}-10", Hora_fin=None if i % 3 else "12:00"))
+           for i in range(6)]
+    app.actualizar_mantencion(ids[1], fila(maquina="Prensa", fecha="2023-12-31", tipo="Preventivo",
+                                          Frecuencia_dias=30, Próximo_mantenimiento="2024-01-30"))
+    app.eliminar_mantencion(ids[4])
+    return ids
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_escrituras_sobreviven_reinicio_y_compactacion(preparar, backend):
+    app = preparar(backend)
+    ids = _escrituras(app)
+    esperados = _registros(app)
+    assert esperados['ID'].tolist() == [i for i in ids if i != ids[4]]
+    assert esperados.set_index('ID').loc[ids[1], 'Máquina'] == "Prensa"
+
+    # Otro proceso (almacén y cachés nuevos) lee lo mismo
+    app = preparar(backend)
+    assert_frame_equal(_registros(app), esperados)
+
+    # Reescritura completa (compactación en el CSV) sin perder IDs ni valores
+    app.guardar_mantenciones(app.cargar_mantenciones())
+    app = preparar(backend)
+    assert_frame_equal(_registros(app), esperados)
+
+    nuevo = app.insertar_mantencion(fila(maquina="Cortadora"))
+    assert nuevo > max(ids)
+
+
+def test_journal_pendiente_se_confirma_en_la_siguiente_escritura(preparar):
+    app = preparar('csv')
+    _escrituras(app)
+    almacen = app.obtener_almacen()
+
+    # Un escritor que se cayó después de anotar en el journal y antes de confirmar
+    huerfano = almacen._registrar({'op': 'agregar', 'fila': fila(maquina="Huerfana")})
+    assert huerfano not in set(app.cargar_mantenciones()['ID'])
+
+    app = preparar('csv')
+    app.insertar_mantencion(fila(maquina="Cortadora"))
+    assert huerfano in set(app.cargar_mantenciones()['ID'])
+    assert app.obtener_almacen()._leer_journal() == []
+
+    esperados = _registros(app)
+    app.obtener_almacen().compactar()
+    app._invalidar_cache()
+    assert_frame_equal(_registros(app), esperados)
+
+
+def test_compactacion_automatica_conserva_los_datos(preparar, monkeypatch):
+    app = preparar('csv')
+    monkeypatch.setattr(app, "COMPACTAR_CADA", 2)
+    _escrituras(app)
+    for i in range(5):
+        app.insertar_mantencion(fila(fecha=f"2025-07-0{i + 1}"))
+    esperados = _registros(app)
+
+    app = preparar('csv')
+    assert_frame_equal(_registros(app), esperados)
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta, timezone
+
+from conftest import fila
+
+
+def _con_datos(cliente):
+    import app
+
+    app.insertar_mantencion(fila())
+    return app
+
+
+def test_etag_vigente_responde_304(cliente):
+    _con_datos(cliente)
+    primera = cliente.get('/dashboard')
+    assert primera.status_code == 200
+    etag = primera.headers['ETag']
+
+    segunda = cliente.get('/dashboard', headers={'If-None-Match': etag})
+    assert segunda.status_code == 304
+    assert segunda.headers['ETag'] == etag
+
+
+def test_etag_cambia_con_filtros_usuario_y_datos(cliente):
+    app = _con_datos(cliente)
+    etag = cliente.get('/').headers['ETag']
+
+    assert cliente.get('/?maquina=Selladora', headers={'If-None-Match': etag}).status_code == 200
+
+    with cliente.session_transaction() as sesion:
+        sesion.update(usuario="otro", rol="tecnico")
+    assert cliente.get('/', headers={'If-None-Match': etag}).status_code == 200
+
+    with cliente.session_transaction() as sesion:
+        sesion.update(usuario="admin", rol="admin")
+    app.insertar_mantencion(fila(fecha="2025-03-11"))
+    assert cliente.get('/', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_if_modified_since_solo_no_responde_304(cliente):
+    _con_datos(cliente)
+    futuro = (datetime.now(timezone.utc) + timedelta(days=1)).strftime('%a, %d %b %Y %H:%M:%S GMT')
+    respuesta = cliente.get('/?maquina=Selladora', headers={'If-Modified-Since': futuro})
+    assert respuesta.status_code == 200
+
+
+def test_avisos_pendientes_se_conservan_en_vistas_sin_avisos(cliente):
+    _con_datos(cliente)
+    etag = cliente.get('/').headers['ETag']
+
+    with cliente.session_transaction() as sesion:
+        sesion['_flashes'] = [('success', "Mantenimiento agregado exitosamente")]
+    assert cliente.get('/', headers={'If-None-Match': etag}).status_code == 304
+    with cliente.session_transaction() as sesion:
+        assert sesion['_flashes'] == [('success', "Mantenimiento agregado exitosamente")]
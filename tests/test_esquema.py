@@ -0,0 +1,29 @@
+from conftest import fila
+
+
+def test_frecuencia_fuera_de_rango_se_rechaza(cliente):
+    import app
+
+    formulario = {
+        'maquina': "Selladora", 'fecha': "2025-03-10", 'descripcion': "x", 'responsable': "Ana",
+        'tipo': "Preventivo", 'frecuencia_dias': "40000"
+    }
+    respuesta = cliente.post('/agregar', data=formulario)
+    assert respuesta.status_code == 302
+    assert app.cargar_mantenciones().empty
+
+    app.insertar_mantencion(fila())
+    id_registro = int(app.cargar_mantenciones()['ID'].iloc[0])
+    cliente.post(f'/editar/{id_registro}', data=formulario)
+    assert app.obtener_mantencion(id_registro)['Frecuencia_dias'] is app.pd.NA
+
+
+def test_frecuencia_guardada_fuera_de_rango_no_rompe_la_carga(cliente):
+    import app
+
+    app.insertar_mantencion(fila(tipo="Preventivo", Frecuencia_dias=40000, Próximo_mantenimiento="2025-04-10"))
+    df = app.cargar_mantenciones()
+    assert str(df['Frecuencia_dias'].dtype) == 'Int16'
+    assert df['Frecuencia_dias'].isna().all()
+    for ruta in ('/', '/dashboard', '/preventivos', '/mtbf', '/api/calendario'):
+        assert cliente.get(ruta).status_code == 200, ruta
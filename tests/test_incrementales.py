@@ -0,0 +1,85 @@
+import pytest
+
+from conftest import BACKENDS, fila
+
+
+def _escrituras(app):
+    """Altas, ediciones y bajas mezcladas sobre varias máquinas."""
+    for i in range(12):
+        app.insertar_mantencion(fila(
+            maquina=["Selladora", "Prensa", "Cortadora"][i % 3], fecha=f"2025-03-{i + 1:02d}",
+            tipo="Preventivo" if i % 2 else "Correctivo", Frecuencia_dias=30 if i % 2 else None,
+            Próximo_mantenimiento=f"2025-04-{i + 1:02d}" if i % 2 else None
+        ))
+        if i == 0:
+            # Los acumulados e índices se arman con la primera lectura y desde ahí se actualizan
+            app.indicadores_mantenciones()
+            app.indice_vencimientos()
+    ids = app.cargar_mantenciones()['ID'].tolist()
+    app.actualizar_mantencion(ids[1], fila(maquina="Prensa", fecha="2025-02-20", tipo="Preventivo",
+                                          Frecuencia_dias=15, Próximo_mantenimiento="2025-03-07"))
+    app.actualizar_mantencion(ids[4], fila(maquina="Cortadora", Hora_fin="09:00"))
+    app.eliminar_mantencion(ids[2])
+    app.eliminar_mantencion(ids[3])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_kpis_incrementales_igual_al_calculo_completo(preparar, backend):
+    app = preparar(backend)
+    _escrituras(app)
+
+    assert app._agregados['datos'] is not None
+    assert app._agregados['pendientes_verificar'] > 0
+    assert app.diferencias_kpis(app.indicadores_mantenciones(), app.calcular_kpis(app.cargar_mantenciones())) == []
+    assert app.verificar_agregados()[1] == []
+
+
+def test_kpis_con_acumulados_vaciados_por_otra_escritura(preparar, monkeypatch):
+    app = preparar('csv')
+    _escrituras(app)
+    app.indicadores_mantenciones()
+    app.insertar_mantencion(fila(maquina="Prensa", fecha="2025-05-01"))
+    monkeypatch.setattr(app, "VERIFICAR_KPIS_CADA", 0)
+
+    verificar = app.verificar_agregados
+
+    def verificar_y_vaciar():
+        resultado = verificar()
+        # Una escritura concurrente cuya firma no cuadra descarta los acumulados
+        app._agregados.update(firma=None, datos=None)
+        return resultado
+
+    monkeypatch.setattr(app, "verificar_agregados", verificar_y_vaciar)
+    kpis = app.indicadores_mantenciones()
+    assert kpis['total_mantenimientos'] == len(app.cargar_mantenciones())
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_indice_vencimientos_incremental_igual_al_completo(preparar, backend):
+    app = preparar(backend)
+    _escrituras(app)
+
+    assert app._vencimientos['pendientes_verificar'] > 0
+    completo = app.IndiceVencimientos.desde_df(app.cargar_mantenciones())
+    assert app.indice_vencimientos().claves == completo.claves
+    assert app.verificar_vencimientos()[1] == []
+
+
+def test_indice_vencimientos_vaciado_por_otra_escritura(preparar, monkeypatch):
+    import datetime
+
+    app = preparar('csv')
+    _escrituras(app)
+    monkeypatch.setattr(app, "VERIFICAR_KPIS_CADA", 0)
+
+    verificar = app.verificar_vencimientos
+
+    def verificar_y_vaciar():
+        resultado = verificar()
+        app._vencimientos.update(firma=None, datos=None)
+        return resultado
+
+    monkeypatch.setattr(app, "verificar_vencimientos", verificar_y_vaciar)
+    ocurrencias = app.ocurrencias_preventivas(datetime.date(2025, 3, 1), datetime.date(2025, 4, 30),
+                                              hoy=datetime.date(2025, 3, 1))
+    assert not ocurrencias.empty